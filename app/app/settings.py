@@ -45,14 +45,28 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.AccessLogMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.middleware.SessionStackMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
+    'core.middleware.RateLimitHeadersMiddleware',
+    'core.middleware.ProfilingMiddleware',
+]
+
+# Run by SessionStackMiddleware for every path but the token authenticated
+# API routes in SESSION_STACK_EXEMPT_PATHS
+SESSION_STACK_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+SESSION_STACK_EXEMPT_PATHS = ('/api/recipe/', '/api/user/')
+# The admin finds its middleware through SESSION_STACK_MIDDLEWARE
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
 
 ROOT_URLCONF = 'app.urls'
 
@@ -88,6 +102,97 @@ DATABASES = {
     }
 }
 
+# Read replicas, given as comma separated hosts sharing the primary's
+# credentials. Without any, replica_0 points at the primary so the test
+# suite always has a second database to route to.
+DB_REPLICA_HOSTS = [
+    host for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host
+]
+for index, host in enumerate(DB_REPLICA_HOSTS or [os.environ.get('DB_HOST')]):
+    DATABASES[f'replica_{index}'] = dict(
+        DATABASES['default'],
+        HOST=host,
+        TEST={'NAME': f"test_{os.environ.get('DB_NAME')}_replica_{index}"}
+    )
+DATABASE_REPLICAS = [
+    f'replica_{index}' for index in range(len(DB_REPLICA_HOSTS))
+]
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Views whose safe requests may be served by a replica
+REPLICA_VIEW_MODULES = ('recipe.views', 'user.views')
+# Seconds a client reads from the primary after writing
+REPLICA_PIN_SECONDS = 15
+# Seconds before a replica that failed to connect is tried again
+REPLICA_RETRY_SECONDS = 30
+
+# Hide deleted users and recipes at once and delete their rows in batches
+# with manage.py delete_pending instead of one cascading transaction
+DEFERRED_DELETION = False
+
+# Background jobs run by manage.py run_worker
+JOB_MAX_ATTEMPTS = 3
+# Seconds before the first retry, doubled for every further attempt
+JOB_RETRY_BACKOFF = 10
+# Seconds between the heartbeats of a running job, and without one after
+# which the job is assumed lost and queued again
+JOB_HEARTBEAT_SECONDS = 30
+JOB_TIMEOUT = 10 * 60
+# Seconds completed jobs are kept for inspection
+JOB_RETENTION = 24 * 60 * 60
+
+# Delta sync, tombstones older than the retention are compacted by
+# compact_changes and clients behind them must sync from scratch
+SYNC_PAGE_SIZE = 500
+SYNC_TOMBSTONE_RETENTION = 30 * 24 * 60 * 60
+
+# Change events streamed by the ASGI app at /api/events/. 'postgres'
+# shares them between processes with LISTEN/NOTIFY, 'local' keeps them
+# in process, and None picks by the default database engine.
+EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND') or None
+EVENTS_HEARTBEAT_SECONDS = 15
+# Events buffered per stream before a slow client is sent a reset
+EVENTS_BUFFER_SIZE = 100
+EVENTS_RETRY_SECONDS = 5
+# Seconds a browser event stream ticket can be used to connect
+EVENTS_TICKET_SECONDS = 60
+
+# Staff requests with X-Profile: 1 or ?profile=1 to these views are run
+# under cProfile, the newest PROFILE_MAX_COUNT profiles are kept
+PROFILE_VIEW_MODULES = ('recipe.views', 'user.views')
+PROFILE_DIR = '/vol/web/profiles'
+PROFILE_MAX_COUNT = 100
+
+# The default cache must be shared by all workers and have atomic add()
+# and incr(), which the recompute locks of TieredCache and the version
+# keys of fragments, similarity and autocomplete rely on. Memcached does,
+# FileBasedCache and DatabaseCache do not (check core.W001). The in
+# process LocMemCache fallback only suits tests and development.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+# Tiered caches keep up to CACHE_LOCAL_MAX_ENTRIES values per process for
+# CACHE_LOCAL_TIMEOUT seconds in front of the CACHE_SHARED_ALIAS cache.
+# A worker recomputing a value holds its lock for up to CACHE_LOCK_TIMEOUT
+# seconds while the others poll for the result.
+CACHE_SHARED_ALIAS = 'default'
+CACHE_LOCAL_TIMEOUT = 2
+CACHE_LOCAL_MAX_ENTRIES = 10000
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_POLL_SECONDS = 0.05
+
+# JSON lines access log, disabled unless ACCESS_LOG_PATH is set. Requests
+# answered below 400 are kept with probability ACCESS_LOG_SAMPLE_RATE and
+# records beyond ACCESS_LOG_QUEUE_SIZE waiting to be written are dropped.
+ACCESS_LOG_PATH = os.environ.get('ACCESS_LOG_PATH') or None
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', 1))
+ACCESS_LOG_QUEUE_SIZE = 10000
+ACCESS_LOG_BATCH_SIZE = 500
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -131,10 +236,72 @@ MEDIA_URL = '/media/'
 STATIC_ROOT = '/vol/web/static'
 MEDIA_ROOT = '/vol/web/media'
 
+# Media serving
+# Set MEDIA_SENDFILE_BACKEND to 'nginx' (X-Accel-Redirect) or 'apache'
+# (X-Sendfile) to let the front-end server transfer uploaded files.
+# MEDIA_SENDFILE_URL is the internal nginx location mapped to MEDIA_ROOT.
+MEDIA_SENDFILE_BACKEND = os.environ.get('MEDIA_SENDFILE_BACKEND')
+MEDIA_SENDFILE_URL = '/protected-media/'
+# Uploaded file names are never reused, so they can be cached forever
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+# 'uuid' gives every upload a fresh name, 'content' stores recipe images
+# under their SHA-256 digest so identical uploads share one file
+RECIPE_IMAGE_STORAGE = os.environ.get('RECIPE_IMAGE_STORAGE', 'uuid')
+
+# Resized recipe image variants
+RECIPE_IMAGE_WIDTHS = (160, 320, 480, 640, 960, 1280, 1920)
+RECIPE_IMAGE_QUALITIES = (50, 75, 90)
+RECIPE_IMAGE_DEFAULT_QUALITY = 75
+# Seconds clients may reuse a resized image before revalidating it
+RECIPE_IMAGE_MAX_AGE = 60
+RECIPE_IMAGE_CACHE_DIR = '/vol/web/cache/recipe'
+RECIPE_IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Widths resized in the background right after an upload
+RECIPE_IMAGE_WARM_WIDTHS = ()
+
+# Number of users whose similar recipe bitsets each process keeps
+RECIPE_SIMILARITY_CACHED_USERS = 256
+
+# Tag and ingredient name autocomplete, users with more names than
+# RECIPE_AUTOCOMPLETE_MAX_NAMES are answered from the database
+RECIPE_AUTOCOMPLETE_CACHED_USERS = 1024
+RECIPE_AUTOCOMPLETE_MAX_NAMES = 10000
+
+# Seconds rendered recipes are kept in the default cache
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.User'
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': ['core.throttling.TokenBucketThrottle'],
+}
+
+# Token bucket rate limits per user (or client address when anonymous)
+RATE_LIMITS = {
+    'read': '600/min',
+    'write': '120/min',
+    'upload': '30/min',
+}
+# Memory mapped file holding the buckets, shared by the workers of a host
+RATE_LIMIT_FILE = os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else '/tmp',
+    'recipe-app-rate-limits'
+)
+RATE_LIMIT_SLOTS = 65536
+
+# Directory of the per process metrics files summed by /metrics. Clear
+# it when the service starts so files of old workers do not linger.
+METRICS_DIR = os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else '/tmp',
+    'recipe-app-metrics'
+)
+# /metrics answers clients from these addresses, or sending METRICS_TOKEN
+# as a bearer token
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
\ No newline at end of file
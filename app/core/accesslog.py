@@ -0,0 +1,135 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from core.metrics import ACCESS_LOG_DROPPED
+
+_STOP = object()
+# Seconds close() waits for the writer before giving up on its records
+CLOSE_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+def format_record(record):
+    """Return an access record tuple as one JSON line"""
+    timestamp, user_id, method, route, status, duration, queries = record
+    return json.dumps({
+        'time': datetime.fromtimestamp(timestamp, timezone.utc).isoformat(
+            timespec='milliseconds'
+        ),
+        'user': user_id,
+        'method': method,
+        'route': route,
+        'status': status,
+        'ms': round(duration * 1000, 2),
+        'queries': queries,
+    }, separators=(',', ':')) + '\n'
+
+
+class AccessLogWriter(threading.Thread):
+    """Appends access records to a file as batched JSON lines
+
+    Requests only put a tuple on a bounded queue; formatting and writing
+    happen on this thread, which writes whatever has queued up in one
+    call. When the disk falls behind and the queue is full, records are
+    dropped and counted rather than blocking the request.
+    """
+
+    def __init__(self, path, size, batch_size):
+        super().__init__(name='access-log', daemon=True)
+        self.path = path
+        self.pid = os.getpid()
+        self.batch_size = batch_size
+        self.queue = queue.Queue(size)
+
+    def put(self, record):
+        """Queue a record, dropping it if the queue is full"""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            ACCESS_LOG_DROPPED.inc(())
+
+    def run(self):
+        try:
+            log_file = open(self.path, 'a', encoding='utf-8')
+        except OSError:
+            # Records keep queuing up and are dropped once it is full
+            logger.exception('Cannot open the access log %s', self.path)
+            return
+        with log_file:
+            stopped = False
+            while not stopped:
+                batch = [self.queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stopped = _STOP in batch
+                log_file.write(''.join(
+                    format_record(record) for record in batch
+                    if record is not _STOP
+                ))
+                log_file.flush()
+                for _ in batch:
+                    self.queue.task_done()
+
+    def flush(self):
+        """Wait until every queued record is written"""
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks and self.is_alive():
+                self.queue.all_tasks_done.wait(0.1)
+
+    def close(self):
+        """Write the queued records and stop the thread
+
+        Gives up after CLOSE_TIMEOUT seconds, so a writer that died or
+        hangs on the disk cannot block the process from exiting.
+        """
+        if not self.is_alive():
+            return
+        try:
+            self.queue.put(_STOP, timeout=CLOSE_TIMEOUT)
+        except queue.Full:
+            return
+        self.join(CLOSE_TIMEOUT)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Return the running access log writer of this process"""
+    global _writer
+    writer = _writer
+    if writer is None or writer.pid != os.getpid() or \
+            writer.path != settings.ACCESS_LOG_PATH:
+        with _writer_lock:
+            if _writer is not None and _writer.pid == os.getpid():
+                _writer.close()
+            writer = AccessLogWriter(
+                settings.ACCESS_LOG_PATH,
+                settings.ACCESS_LOG_QUEUE_SIZE,
+                settings.ACCESS_LOG_BATCH_SIZE
+            )
+            writer.start()
+            _writer = writer
+    return writer
+
+
+@atexit.register
+def close_writer():
+    """Stop the writer of this process once its records are written"""
+    global _writer
+    with _writer_lock:
+        if _writer is not None and _writer.pid == os.getpid():
+            _writer.close()
+        _writer = None
@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core.caching import TieredCache
+
+tokens = TieredCache('tokens', 300)
+
+# User fields kept in the tokens cache, the others are loaded on access
+USER_FIELDS = ('id', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _load_token(key):
+    """Return the cached USER_FIELDS of the owner of a token"""
+    # Read from the primary so a lagging replica cannot revive a token
+    return Token.objects.using('default').filter(key=key).values_list(
+        *(f'user__{field}' for field in USER_FIELDS)
+    ).first()
+
+
+def _build_user(values):
+    """Return a user with only USER_FIELDS loaded"""
+    model = get_user_model()
+    data = dict(zip(USER_FIELDS, values))
+    # from_db expects the loaded fields in model order
+    names = [
+        field.attname for field in model._meta.concrete_fields
+        if field.attname in data
+    ]
+    return model.from_db('default', names, [data[name] for name in names])
+
+
+def forget_token(key):
+    """Drop a token from the tokens cache, again once the change commits"""
+    tokens.delete(key)
+    # A request may have cached the old token before the change committed
+    transaction.on_commit(lambda: tokens.delete(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication resolving tokens through the tokens cache
+
+    Only USER_FIELDS of the user are cached, other fields such as the
+    password hash are deferred and read from the database when used.
+    Entries are dropped when the token or its user is saved or deleted.
+    """
+
+    def authenticate_credentials(self, key):
+        values = tokens.get(key, lambda: _load_token(key))
+        if values is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user = _build_user(values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        token = Token.from_db('default', ('key', 'user_id'), (key, user.pk))
+        token.user = user
+        return (user, token)
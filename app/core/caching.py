@@ -0,0 +1,126 @@
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.metrics import record_cache
+
+
+class TieredCache:
+    """A namespace of cached values, kept in process in front of a cache
+
+    Values are looked up in a small per-process LRU first and then in the
+    shared CACHE_SHARED_ALIAS backend, so changes made by other processes
+    are seen at most CACHE_LOCAL_TIMEOUT seconds late. Only the worker
+    holding the shared recompute lock of a key runs compute, others wait
+    for its result. Entries are recomputed early with a probability that
+    grows as they near expiry, weighted by how long compute took, so busy
+    keys are refreshed before they expire instead of all at once.
+
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, namespace, timeout, beta=1.0):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.beta = beta
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[settings.CACHE_SHARED_ALIAS]
+
+    def _key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def _expiring(self, entry, now):
+        """Return whether an entry should be recomputed ahead of expiry"""
+        _, delta, expires = entry
+        return now - delta * self.beta * math.log(1 - random.random()) >= \
+            expires
+
+    def _get_local(self, key, now):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            entry, stored = item
+            if now - stored >= settings.CACHE_LOCAL_TIMEOUT:
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _set_local(self, key, entry, now):
+        with self._lock:
+            self._local[key] = (entry, now)
+            self._local.move_to_end(key)
+            while len(self._local) > settings.CACHE_LOCAL_MAX_ENTRIES:
+                self._local.popitem(last=False)
+
+    def get(self, key, compute):
+        """Return the value of key, calling compute() if it is missing"""
+        full_key = self._key(key)
+        now = time.time()
+        entry = self._get_local(full_key, now)
+        if entry is None or self._expiring(entry, now):
+            entry = self.shared.get(full_key)
+            if entry is None or self._expiring(entry, now):
+                return self._refresh(full_key, entry, compute)
+            self._set_local(full_key, entry, now)
+        record_cache(self.namespace, True)
+        return entry[0]
+
+    def _refresh(self, key, entry, compute):
+        lock_key = f'{key}:lock'
+        locked = self.shared.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT)
+        if not locked:
+            if entry is not None:
+                # Another worker is already refreshing it early
+                record_cache(self.namespace, True)
+                return entry[0]
+            entry = self._wait(key)
+            if entry is not None:
+                record_cache(self.namespace, True)
+                return entry[0]
+
+        record_cache(self.namespace, False)
+        try:
+            start = time.time()
+            value = compute()
+            now = time.time()
+            entry = (value, now - start, now + self.timeout)
+            self.shared.set(key, entry, self.timeout)
+            self._set_local(key, entry, now)
+        finally:
+            if locked:
+                self.shared.delete(lock_key)
+        return value
+
+    def _wait(self, key):
+        """Wait for the worker holding the lock to store the value"""
+        deadline = time.time() + settings.CACHE_LOCK_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(settings.CACHE_LOCK_POLL_SECONDS)
+            entry = self.shared.get(key)
+            if entry is not None:
+                self._set_local(key, entry, time.time())
+                return entry
+        return None
+
+    def delete(self, key):
+        """Drop key from the shared cache and this process"""
+        full_key = self._key(key)
+        self.shared.delete(full_key)
+        with self._lock:
+            self._local.pop(full_key, None)
+
+    def clear_local(self):
+        """Forget the values held by this process"""
+        with self._lock:
+            self._local.clear()
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose add() and incr() are not atomic between processes
+NON_ATOMIC_CACHE_BACKENDS = (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when the shared caches cannot hold locks and version keys"""
+    errors = []
+    for alias in dict.fromkeys(('default', settings.CACHE_SHARED_ALIAS)):
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in NON_ATOMIC_CACHE_BACKENDS:
+            errors.append(Warning(
+                f"The '{alias}' cache has no atomic add() or incr().",
+                hint='Recompute locks may be taken twice and version bumps '
+                     'lost, use memcached.',
+                obj=backend,
+                id='core.W001',
+            ))
+    return errors
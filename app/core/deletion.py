@@ -0,0 +1,155 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+
+from rest_framework.authtoken.models import Token
+
+from core.jobs import enqueue
+from core.models import Recipe, Tag, Ingredient, PendingDeletion, Change
+from core.storage import is_content_addressed
+from core.sync import record_changes
+
+
+def schedule_recipe_deletion(user, recipe_ids):
+    """Hide recipes at once and leave their rows to delete_pending"""
+    if not settings.DEFERRED_DELETION:
+        Recipe.objects.filter(user=user, id__in=recipe_ids).delete()
+        return
+    with transaction.atomic():
+        recipes = Recipe.objects.filter(
+            user=user, id__in=recipe_ids, pending_deletion=False
+        )
+        record_changes(
+            user.id, Change.RECIPE, recipes.values_list('id', flat=True),
+            deleted=True
+        )
+        recipes.update(pending_deletion=True)
+        PendingDeletion.objects.select_for_update().get_or_create(user=user)
+        enqueue(delete_pending, unique=True)
+
+
+def schedule_user_deletion(user):
+    """Deactivate a user at once and leave their rows to delete_pending"""
+    if not settings.DEFERRED_DELETION:
+        user.delete()
+        return
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        Token.objects.filter(user=user).delete()
+        Recipe.objects.filter(user=user).update(pending_deletion=True)
+        PendingDeletion.objects.update_or_create(
+            user=user, defaults={'delete_user': True}
+        )
+        enqueue(delete_pending, unique=True)
+
+
+def _delete_in(table, column, ids, returning=None):
+    """Delete rows of table whose column is in ids with one statement
+
+    Returns the number of rows deleted, or the returning column of each
+    deleted row when given.
+    """
+    placeholders = ', '.join(['%s'] * len(ids))
+    sql = f'DELETE FROM {table} WHERE {column} IN ({placeholders})'
+    with connection.cursor() as cursor:
+        if returning is None:
+            cursor.execute(sql, ids)
+            return cursor.rowcount
+        cursor.execute(f'{sql} RETURNING {returning}', ids)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _delete_recipe_batch(user_id, batch_size):
+    """Delete one batch of a user's pending recipes and their links"""
+    ids = list(Recipe.objects.filter(
+        user_id=user_id, pending_deletion=True
+    ).values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    with transaction.atomic():
+        _delete_in(Recipe.tags.through._meta.db_table, 'recipe_id', ids)
+        _delete_in(
+            Recipe.ingredients.through._meta.db_table, 'recipe_id', ids
+        )
+        # Only release the images of rows this run deleted, a concurrent
+        # or requeued run over the same ids releases the others
+        images = _delete_in(Recipe._meta.db_table, 'id', ids, 'image')
+        if is_content_addressed():
+            storage = Recipe._meta.get_field('image').storage
+            for image in images:
+                if image:
+                    storage.release(image)
+    return len(images)
+
+
+def _delete_attribute_batch(model, user_id, batch_size):
+    """Delete one batch of a user's tags or ingredients and their links"""
+    ids = list(model.objects.filter(
+        user_id=user_id
+    ).values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    field = 'tags' if model is Tag else 'ingredients'
+    through = getattr(Recipe, field).through
+    with transaction.atomic():
+        _delete_in(
+            through._meta.db_table, f'{model._meta.model_name}_id', ids
+        )
+        return _delete_in(model._meta.db_table, 'id', ids)
+
+
+def _batches(pending):
+    """Yield the batch deleting functions for a pending deletion"""
+    yield lambda size: _delete_recipe_batch(pending.user_id, size)
+    if pending.delete_user:
+        yield lambda size: _delete_attribute_batch(
+            Tag, pending.user_id, size
+        )
+        yield lambda size: _delete_attribute_batch(
+            Ingredient, pending.user_id, size
+        )
+
+
+def delete_pending(batch_size=500, sleep=0, progress=None):
+    """Delete everything scheduled for deletion in small batches
+
+    Every batch is committed on its own and the pending rows stay in the
+    database until their work is done, so an interrupted run resumes
+    where it stopped. Returns the number of rows deleted.
+    """
+    total = 0
+    for pending in PendingDeletion.objects.order_by('id'):
+        for delete_batch in _batches(pending):
+            while True:
+                with transaction.atomic():
+                    deleted = delete_batch(batch_size)
+                    PendingDeletion.objects.filter(pk=pending.pk).update(
+                        deleted_count=F('deleted_count') + deleted
+                    )
+                if not deleted:
+                    break
+                total += deleted
+                pending.deleted_count += deleted
+                if progress:
+                    progress(pending)
+                if sleep:
+                    time.sleep(sleep)
+
+        with transaction.atomic():
+            if pending.delete_user:
+                # Only the user row and its small leftovers remain
+                get_user_model().objects.filter(pk=pending.user_id).delete()
+                continue
+            # Keep the row if more work was scheduled meanwhile
+            locked = PendingDeletion.objects.select_for_update().filter(
+                pk=pending.pk
+            ).first()
+            if locked and not locked.delete_user and not Recipe.objects.filter(
+                user_id=pending.user_id, pending_deletion=True
+            ).exists():
+                PendingDeletion.objects.filter(pk=pending.pk).delete()
+    return total
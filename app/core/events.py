@@ -0,0 +1,333 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+from urllib.parse import parse_qs
+
+import psycopg2
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import connections, transaction
+from django.http import parse_cookie
+
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.authentication import CachedTokenAuthentication
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = '/api/events/'
+CHANNEL = 'recipe_changes'
+TICKET_SALT = 'core.events.ticket'
+TICKET_COOKIE = 'events_ticket'
+# pg_notify payloads must stay below 8000 bytes
+MAX_PAYLOAD = 7000
+RESET = object()
+
+
+class Broadcaster:
+    """Fans change events out to the event streams of this process
+
+    Every subscriber owns a bounded queue drained by its event loop.
+    Publishing is thread safe and never blocks: a subscriber whose queue
+    is full is sent a reset instead, telling its client to catch up with
+    the changes endpoint.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, size):
+        """Return a queue receiving the events of user_id"""
+        queue = asyncio.Queue(maxsize=size)
+        subscriber = (queue, asyncio.get_event_loop())
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            subscribers.difference_update(
+                [s for s in subscribers if s[0] is queue]
+            )
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def count(self):
+        """Return the number of open subscriptions"""
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, user_id, event):
+        """Queue event for every subscriber of user_id"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # The subscriber's loop is closed
+                self.unsubscribe(user_id, queue)
+
+    @staticmethod
+    def _deliver(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESET)
+
+
+broadcaster = Broadcaster()
+
+
+def _use_notify():
+    backend = settings.EVENTS_BACKEND
+    if backend is None:
+        backend = 'postgres' if connections['default'].vendor == \
+            'postgresql' else 'local'
+    return backend == 'postgres'
+
+
+def publish_change(user_id, seq, model, object_ids, deleted):
+    """Announce a recorded change once its transaction commits
+
+    On PostgreSQL the event is sent with NOTIFY inside the transaction,
+    which delivers it to the listener of every process on commit.
+    Otherwise it only reaches streams of this process.
+    """
+    event = {
+        'user': user_id,
+        'seq': seq,
+        'type': model,
+        'ids': list(object_ids),
+        'deleted': deleted
+    }
+    payload = json.dumps(event)
+    if len(payload) > MAX_PAYLOAD:
+        event['ids'] = None
+        payload = json.dumps(event)
+
+    if _use_notify():
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+    else:
+        transaction.on_commit(lambda: broadcaster.publish(user_id, event))
+
+
+class NotifyListener(threading.Thread):
+    """Feeds NOTIFY events of all processes into the broadcaster"""
+
+    def __init__(self):
+        super().__init__(name='change-listener', daemon=True)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self._listen()
+            except psycopg2.Error:
+                logger.exception('Change listener lost its connection')
+                self.stopped.wait(settings.EVENTS_RETRY_SECONDS)
+
+    def _listen(self):
+        db = settings.DATABASES['default']
+        conn = psycopg2.connect(
+            host=db['HOST'], port=db.get('PORT') or None, dbname=db['NAME'],
+            user=db['USER'], password=db['PASSWORD']
+        )
+        conn.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+        )
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            while not self.stopped.is_set():
+                if select.select([conn], [], [], 1) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def _dispatch(self, payload):
+        """Publish a NOTIFY payload, skipping malformed ones"""
+        try:
+            event = json.loads(payload)
+            user_id = event['user']
+        except (ValueError, KeyError, TypeError):
+            logger.exception('Ignored malformed change event %r', payload)
+            return
+        broadcaster.publish(user_id, event)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listener():
+    """Start the NOTIFY listener of this process if it is not running"""
+    global _listener
+    if not _use_notify():
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = NotifyListener()
+            _listener.start()
+
+
+def stop_listener():
+    """Stop the NOTIFY listener and close its connection"""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stopped.set()
+            _listener.join()
+            _listener = None
+
+
+def issue_ticket(user):
+    """Return a ticket opening the event stream for EVENTS_TICKET_SECONDS
+
+    Browsers cannot set headers on an EventSource, so they pass the
+    ticket in the query string or the TICKET_COOKIE cookie instead of
+    their API token.
+    """
+    return signing.TimestampSigner(salt=TICKET_SALT).sign(str(user.pk))
+
+
+def _ticket_user_id(ticket):
+    try:
+        return int(signing.TimestampSigner(salt=TICKET_SALT).unsign(
+            ticket, max_age=settings.EVENTS_TICKET_SECONDS
+        ))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+@sync_to_async
+def _authenticate(scope):
+    headers = dict(scope['headers'])
+    scheme, _, key = headers.get(b'authorization', b'').decode().partition(
+        ' '
+    )
+    if scheme.lower() == 'token' and key:
+        try:
+            user, _ = CachedTokenAuthentication().authenticate_credentials(
+                key
+            )
+        except AuthenticationFailed:
+            return None
+        return user.pk
+
+    ticket = parse_qs(scope['query_string'].decode()).get('ticket', [''])[0]
+    if not ticket:
+        ticket = parse_cookie(headers.get(b'cookie', b'').decode()).get(
+            TICKET_COOKIE
+        )
+    user_id = _ticket_user_id(ticket) if ticket else None
+    if user_id is None or not get_user_model().objects.filter(
+        pk=user_id, is_active=True
+    ).exists():
+        return None
+    return user_id
+
+
+def _encode(event):
+    if event is RESET:
+        return b'event: reset\ndata: {}\n\n'
+    data = {k: v for k, v in event.items() if k != 'user'}
+    return (
+        f"id: {event['seq']}\nevent: change\ndata: {json.dumps(data)}\n\n"
+    ).encode()
+
+
+async def _stream(send, queue):
+    while True:
+        try:
+            event = await asyncio.wait_for(
+                queue.get(), settings.EVENTS_HEARTBEAT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            await send({
+                'type': 'http.response.body',
+                'body': b': ping\n\n',
+                'more_body': True
+            })
+            continue
+        await send({
+            'type': 'http.response.body',
+            'body': _encode(event),
+            'more_body': True
+        })
+        if event is RESET:
+            return
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def event_stream(scope, receive, send):
+    """ASGI app streaming the user's change events as Server-Sent Events
+
+    Authenticates with the same Token header as the API, or with a ticket
+    from issue_ticket() for browsers. Events carry the
+    change sequence number as their id, and a reset event ends the stream
+    when the client fell too far behind.
+    """
+    user_id = await _authenticate(scope)
+    if user_id is None:
+        await send({
+            'type': 'http.response.start',
+            'status': 401,
+            'headers': [(b'content-type', b'application/json')]
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'{"detail": "Invalid or missing token or ticket."}'
+        })
+        return
+
+    await sync_to_async(ensure_listener)()
+    queue = broadcaster.subscribe(user_id, settings.EVENTS_BUFFER_SIZE)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'retry: 5000\n\n',
+            'more_body': True
+        })
+        tasks = [
+            asyncio.ensure_future(_stream(send, queue)),
+            asyncio.ensure_future(_wait_for_disconnect(receive)),
+        ]
+        try:
+            done, _ = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            for task in tasks:
+                task.cancel()
+        if tasks[0] in done:
+            tasks[0].result()
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        broadcaster.unsubscribe(user_id, queue)
@@ -0,0 +1,129 @@
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import Job
+
+
+def enqueue(func, *args, delay=0, max_attempts=None, unique=False):
+    """Queue a call of the module level function func for run_worker
+
+    Enqueuing inside a transaction commits the job together with the
+    rest of the work. With unique, nothing is queued if the same call is
+    already waiting.
+    """
+    name = f'{func.__module__}.{func.__qualname__}'
+    if unique and Job.objects.filter(
+        name=name, args=list(args), status=Job.QUEUED
+    ).exists():
+        return None
+    return Job.objects.create(
+        name=name,
+        args=list(args),
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS
+    )
+
+
+def claim_job():
+    """Mark the next due job as running and return it"""
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.QUEUED,
+            run_at__lte=timezone.now()
+        ).order_by('run_at', 'id').first()
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(update_fields=[
+            'status', 'attempts', 'started_at', 'heartbeat_at'
+        ])
+    return job
+
+
+@contextmanager
+def _heartbeat(job):
+    """Refresh heartbeat_at of the running job every JOB_HEARTBEAT_SECONDS"""
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(settings.JOB_HEARTBEAT_SECONDS):
+                Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(
+                    heartbeat_at=timezone.now()
+                )
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(
+        target=beat, name=f'job-{job.pk}-heartbeat', daemon=True
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_job(job):
+    """Run a claimed job, scheduling a retry with backoff if it fails"""
+    start = time.perf_counter()
+    try:
+        with _heartbeat(job):
+            import_string(job.name)(*job.args)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            backoff = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.run_at = timezone.now() + timedelta(seconds=backoff)
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.DONE
+        job.last_error = ''
+    job.duration = time.perf_counter() - start
+    job.finished_at = timezone.now()
+    job.save(update_fields=[
+        'status', 'run_at', 'duration', 'finished_at', 'last_error'
+    ])
+    return job
+
+
+def requeue_stale_jobs(timeout):
+    """Requeue running jobs without a heartbeat for timeout seconds"""
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return Job.objects.filter(
+        Q(heartbeat_at__lt=cutoff) |
+        Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=Job.RUNNING
+    ).update(status=Job.QUEUED)
+
+
+def purge_finished_jobs(age):
+    """Delete completed jobs older than age seconds"""
+    return Job.objects.filter(
+        status=Job.DONE,
+        finished_at__lt=timezone.now() - timedelta(seconds=age)
+    ).delete()[0]
+
+
+def run_pending_jobs():
+    """Run every due job in the current thread, mostly for tests"""
+    jobs = []
+    while True:
+        job = claim_job()
+        if job is None:
+            return jobs
+        jobs.append(run_job(job))
@@ -0,0 +1,30 @@
+import tempfile
+import time
+
+from django.core.management import BaseCommand
+from django.test import override_settings
+
+from core.metrics import record_request
+
+
+class Command(BaseCommand):
+    """Django command to measure the cost of recording request metrics"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100000)
+        parser.add_argument('--routes', type=int, default=50)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        routes = [f'route-{i}' for i in range(options['routes'])]
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory):
+            start = time.perf_counter()
+            for i in range(iterations):
+                record_request(routes[i % len(routes)], 'GET', 0.02, 3,
+                               0.004, 1500)
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{elapsed / iterations * 1e6:.2f} us per recorded request'
+        )
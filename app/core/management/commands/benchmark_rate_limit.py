@@ -0,0 +1,31 @@
+import os
+import tempfile
+import time
+
+from django.core.management import BaseCommand
+
+from core.throttling import SharedTokenBuckets
+
+
+class Command(BaseCommand):
+    """Django command to measure the cost of a rate limit check"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200000)
+        parser.add_argument('--keys', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        keys = [f'read:user:{i}' for i in range(options['keys'])]
+        with tempfile.TemporaryDirectory() as directory:
+            buckets = SharedTokenBuckets(
+                os.path.join(directory, 'buckets'), 65536
+            )
+            start = time.perf_counter()
+            for i in range(iterations):
+                buckets.consume(keys[i % len(keys)], 600, 10.0)
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{elapsed / iterations * 1e6:.2f} us per rate limit check'
+        )
@@ -0,0 +1,101 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from core.models import Recipe, StoredImage
+
+RECIPE_IMAGE_DIR = 'uploads/recipe'
+
+
+class Command(BaseCommand):
+    """Django command to delete recipe images no recipe references"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-period', type=int, default=24 * 60 * 60,
+            help='Skip files modified less than this many seconds ago'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of file names checked per database query'
+        )
+        parser.add_argument(
+            '--max-rate', type=float, default=100.0,
+            help='Maximum deletions per second, 0 for unlimited'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report orphaned files without deleting them'
+        )
+
+    def handle(self, *args, **options):
+        directory = os.path.join(settings.MEDIA_ROOT, RECIPE_IMAGE_DIR)
+        if not os.path.isdir(directory):
+            self.stdout.write('Nothing to collect')
+            return
+
+        self.dry_run = options['dry_run']
+        self.interval = 1 / options['max_rate'] if options['max_rate'] else 0
+        self.next_delete = time.monotonic()
+        self.scanned = self.orphaned = self.freed = 0
+        self.cutoff = cutoff = time.time() - options['grace_period']
+
+        batch = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                self.scanned += 1
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime > cutoff:
+                    continue
+                batch.append((entry, stat.st_size))
+                if len(batch) >= options['batch_size']:
+                    self._collect(batch)
+                    batch = []
+        if batch:
+            self._collect(batch)
+
+        action = 'Would delete' if self.dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {self.scanned} files. {action} {self.orphaned} '
+            f'orphaned files ({self.freed} bytes)'
+        ))
+
+    def _collect(self, batch):
+        """Delete the files in batch that are not referenced"""
+        names = [f'{RECIPE_IMAGE_DIR}/{entry.name}' for entry, _ in batch]
+        referenced = set(Recipe.objects.filter(
+            image__in=names
+        ).values_list('image', flat=True))
+        referenced.update(StoredImage.objects.filter(
+            name__in=names
+        ).values_list('name', flat=True))
+
+        for name, (entry, size) in zip(names, batch):
+            if name in referenced:
+                continue
+            if self.dry_run:
+                self.stdout.write(f'Orphaned: {name}')
+            else:
+                self._throttle()
+                try:
+                    # An upload reusing the file since its batch was
+                    # checked touched it, see RecipeImageStorage._save
+                    if os.stat(entry.path).st_mtime > self.cutoff:
+                        continue
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+            self.orphaned += 1
+            self.freed += size
+
+    def _throttle(self):
+        """Sleep as needed to stay under the maximum deletion rate"""
+        now = time.monotonic()
+        if self.next_delete > now:
+            time.sleep(self.next_delete - now)
+            now = self.next_delete
+        self.next_delete = now + self.interval
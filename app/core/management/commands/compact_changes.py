@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from core.sync import compact_tombstones
+
+
+class Command(BaseCommand):
+    """Django command to delete old tombstones from the sync change log"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--age', type=int, default=None,
+            help='Seconds to keep tombstones, SYNC_TOMBSTONE_RETENTION '
+                 'by default'
+        )
+
+    def handle(self, *args, **options):
+        age = options['age']
+        if age is None:
+            age = settings.SYNC_TOMBSTONE_RETENTION
+        total = compact_tombstones(age)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} tombstones'))
@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+
+from core.deletion import delete_pending
+
+
+class Command(BaseCommand):
+    """Django command to delete scheduled users and recipes in batches"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--sleep', type=float, default=0.05,
+            help='Seconds to pause between batches'
+        )
+
+    def handle(self, *args, **options):
+        def progress(pending):
+            self.stdout.write(
+                f'User {pending.user_id}: '
+                f'{pending.deleted_count} rows deleted'
+            )
+
+        total = delete_pending(
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} rows'))
@@ -0,0 +1,310 @@
+import time
+
+from django.apps import apps
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+# Table, partition key and the statements creating its indexes and foreign
+# keys. Django's auto-created through tables have no user_id column, and
+# every query against them is keyed by recipe_id, so they are partitioned
+# on recipe_id instead. A foreign key to core_recipe would have to cover
+# its (user_id, id) primary key, so the recipe_id references are enforced
+# by the triggers of RECIPE_LINK_TRIGGERS instead. The primary keys lead
+# with the partition key, so lookups by id alone get their own index.
+PARTITIONED_TABLES = (
+    ('core_recipe', 'user_id', (
+        'CREATE INDEX core_recipe_id_idx ON {table} (id)',
+        'ALTER TABLE {table} ADD FOREIGN KEY (user_id) '
+        'REFERENCES core_user (id) DEFERRABLE INITIALLY DEFERRED',
+    )),
+    ('core_recipe_tags', 'recipe_id', (
+        'CREATE UNIQUE INDEX ON {table} (recipe_id, tag_id)',
+        'CREATE INDEX ON {table} (tag_id)',
+        'ALTER TABLE {table} ADD FOREIGN KEY (tag_id) '
+        'REFERENCES core_tag (id) DEFERRABLE INITIALLY DEFERRED',
+    )),
+    ('core_recipe_ingredients', 'recipe_id', (
+        'CREATE UNIQUE INDEX ON {table} (recipe_id, ingredient_id)',
+        'CREATE INDEX ON {table} (ingredient_id)',
+        'ALTER TABLE {table} ADD FOREIGN KEY (ingredient_id) '
+        'REFERENCES core_ingredient (id) DEFERRABLE INITIALLY DEFERRED',
+    )),
+)
+RECIPE_LINK_TABLES = ('core_recipe_tags', 'core_recipe_ingredients')
+RECIPE_LINK_TRIGGERS = (
+    # Like a foreign key check, lock the recipe against concurrent deletes
+    '''
+    CREATE OR REPLACE FUNCTION core_recipe_link_check() RETURNS trigger AS $$
+    BEGIN
+        PERFORM 1 FROM core_recipe WHERE id = NEW.recipe_id FOR KEY SHARE;
+        IF NOT FOUND THEN
+            RAISE foreign_key_violation USING MESSAGE =
+                format('recipe %s does not exist', NEW.recipe_id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION core_recipe_links_delete() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM core_recipe_tags WHERE recipe_id = OLD.id;
+        DELETE FROM core_recipe_ingredients WHERE recipe_id = OLD.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS core_recipe_links_delete ON core_recipe',
+    'CREATE TRIGGER core_recipe_links_delete AFTER DELETE ON core_recipe '
+    'FOR EACH ROW EXECUTE FUNCTION core_recipe_links_delete()',
+) + tuple(
+    statement.format(table=table)
+    for table in RECIPE_LINK_TABLES
+    for statement in (
+        'DROP TRIGGER IF EXISTS {table}_recipe_check ON {table}',
+        'CREATE TRIGGER {table}_recipe_check '
+        'AFTER INSERT OR UPDATE OF recipe_id ON {table} '
+        'FOR EACH ROW EXECUTE FUNCTION core_recipe_link_check()',
+    )
+)
+PROGRESS_TABLE = 'core_partition_backfill'
+# Hash partitioning, primary keys on partitioned tables and EXECUTE
+# FUNCTION in triggers
+MIN_PG_VERSION = 110000
+
+
+def model_indexes(table):
+    """Return the name and columns of the Meta indexes of table's model"""
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.db_table == table:
+            return [
+                (index.name, [
+                    model._meta.get_field(field).column
+                    for field in index.fields
+                ])
+                for index in model._meta.indexes
+            ]
+    return []
+
+
+class Command(BaseCommand):
+    """Django command to hash partition the recipe tables on PostgreSQL
+
+    The conversion runs online: partitioned copies of the tables are
+    created, kept in sync by triggers, backfilled in small batches and
+    swapped in with a short exclusive lock. Re-running the command after
+    an interruption resumes the backfill where it stopped.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partitions', type=int, default=16)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--sleep', type=float, default=0.1,
+            help='Seconds to pause between backfill batches'
+        )
+        parser.add_argument(
+            '--maintenance', action='store_true',
+            help='Vacuum and analyze each partition instead of converting'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning requires PostgreSQL')
+        connection.ensure_connection()
+        if connection.pg_version < MIN_PG_VERSION:
+            raise CommandError('Partitioning requires PostgreSQL 11 or newer')
+
+        if options['maintenance']:
+            self._maintain()
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} '
+                '(table_name text PRIMARY KEY, last_id bigint NOT NULL)'
+            )
+        for table, key, statements in PARTITIONED_TABLES:
+            if self._is_partitioned(table):
+                self.stdout.write(f'{table} is already partitioned')
+                continue
+            self._prepare(table, key, statements, options['partitions'])
+            self._backfill(
+                table, key, options['batch_size'], options['sleep']
+            )
+        self._swap()
+        self.stdout.write(self.style.SUCCESS('Recipe tables partitioned'))
+
+    def _execute(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.description:
+                return cursor.fetchall()
+
+    def _is_partitioned(self, table):
+        return bool(self._execute(
+            'SELECT 1 FROM pg_partitioned_table '
+            'WHERE partrelid = to_regclass(%s)', [table]
+        ))
+
+    def _prepare(self, table, key, statements, partitions):
+        """Create the partitioned copy of table and its sync trigger"""
+        new_table = f'{table}_partitioned'
+        if self._execute('SELECT to_regclass(%s)', [new_table])[0][0]:
+            return
+
+        columns = [row[0] for row in self._execute(
+            'SELECT attname FROM pg_attribute '
+            'WHERE attrelid = %s::regclass AND attnum > 0 '
+            'AND NOT attisdropped ORDER BY attnum', [table]
+        )]
+        updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in columns)
+
+        with transaction.atomic():
+            self._execute(
+                f'CREATE TABLE {new_table} (LIKE {table} INCLUDING DEFAULTS '
+                f'INCLUDING CONSTRAINTS) PARTITION BY HASH ({key})'
+            )
+            self._execute(
+                f'ALTER TABLE {new_table} ADD PRIMARY KEY ({key}, id)'
+            )
+            for remainder in range(partitions):
+                self._execute(
+                    f'CREATE TABLE {table}_p{remainder} PARTITION OF '
+                    f'{new_table} FOR VALUES WITH '
+                    f'(MODULUS {partitions}, REMAINDER {remainder})'
+                )
+            for statement in statements:
+                self._execute(statement.format(table=new_table))
+            # Index names are unique per schema, the Django names move
+            # over in _swap
+            for name, columns in model_indexes(table):
+                self._execute(
+                    f'CREATE INDEX {name}_partitioned ON {new_table} '
+                    f'({", ".join(columns)})'
+                )
+
+            # Mirror concurrent writes so the backfill only has to copy
+            # rows that existed before the trigger
+            self._execute(f'''
+                CREATE FUNCTION {table}_partition_sync() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP <> 'INSERT' THEN
+                        DELETE FROM {new_table}
+                        WHERE {key} = OLD.{key} AND id = OLD.id;
+                    END IF;
+                    IF TG_OP <> 'DELETE' THEN
+                        INSERT INTO {new_table} SELECT NEW.*
+                        ON CONFLICT ({key}, id) DO UPDATE SET {updates};
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+            ''')
+            self._execute(
+                f'CREATE TRIGGER {table}_partition_sync '
+                f'AFTER INSERT OR UPDATE OR DELETE ON {table} '
+                f'FOR EACH ROW EXECUTE FUNCTION {table}_partition_sync()'
+            )
+            self._execute(
+                f'INSERT INTO {PROGRESS_TABLE} VALUES (%s, 0) '
+                'ON CONFLICT DO NOTHING', [table]
+            )
+
+    def _backfill(self, table, key, batch_size, sleep):
+        """Copy existing rows in batches, recording progress as it goes"""
+        new_table = f'{table}_partitioned'
+        last_id = self._execute(
+            f'SELECT last_id FROM {PROGRESS_TABLE} WHERE table_name = %s',
+            [table]
+        )[0][0]
+        max_id = self._execute(f'SELECT max(id) FROM {table}')[0][0] or 0
+
+        while last_id < max_id:
+            upper = min(last_id + batch_size, max_id)
+            with transaction.atomic():
+                # FOR SHARE makes concurrent updates and deletes of these
+                # rows wait, so their triggers see the copied rows
+                self._execute(
+                    f'INSERT INTO {new_table} SELECT * FROM {table} '
+                    'WHERE id > %s AND id <= %s FOR SHARE '
+                    f'ON CONFLICT ({key}, id) DO NOTHING', [last_id, upper]
+                )
+                self._execute(
+                    f'UPDATE {PROGRESS_TABLE} SET last_id = %s '
+                    'WHERE table_name = %s', [upper, table]
+                )
+            last_id = upper
+            self.stdout.write(f'{table}: copied up to id {last_id}/{max_id}')
+            if sleep:
+                time.sleep(sleep)
+
+    def _swap(self):
+        """Replace the original tables with their partitioned copies"""
+        tables = [
+            table for table, _, _ in PARTITIONED_TABLES
+            if not self._is_partitioned(table)
+        ]
+        if not tables:
+            return
+
+        with transaction.atomic():
+            self._execute(
+                f'LOCK TABLE {", ".join(tables)} IN ACCESS EXCLUSIVE MODE'
+            )
+            # Foreign keys cannot be dropped with deferred checks pending
+            self._execute('SET CONSTRAINTS ALL IMMEDIATE')
+            for table in tables:
+                old_table = f'{table}_unpartitioned'
+                self._execute(
+                    f'DROP TRIGGER {table}_partition_sync ON {table}'
+                )
+                self._execute(f'DROP FUNCTION {table}_partition_sync()')
+                # Keep the old rows for verification, but stop them from
+                # holding foreign key references
+                for name, in self._execute(
+                    'SELECT conname FROM pg_constraint '
+                    "WHERE conrelid = %s::regclass AND contype = 'f'",
+                    [table]
+                ):
+                    self._execute(
+                        f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'
+                    )
+                self._execute(f'ALTER TABLE {table} RENAME TO {old_table}')
+                for name, _ in model_indexes(table):
+                    self._execute(
+                        f'ALTER INDEX {name} RENAME TO {name}_unpartitioned'
+                    )
+                    self._execute(
+                        f'ALTER INDEX {name}_partitioned RENAME TO {name}'
+                    )
+                self._execute(
+                    f'ALTER TABLE {table}_partitioned RENAME TO {table}'
+                )
+                self._execute(
+                    f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id'
+                )
+                self._execute(
+                    f'DELETE FROM {PROGRESS_TABLE} WHERE table_name = %s',
+                    [table]
+                )
+                self.stdout.write(
+                    f'{table} swapped, previous rows kept in {old_table}'
+                )
+            for statement in RECIPE_LINK_TRIGGERS:
+                self._execute(statement)
+
+    def _maintain(self):
+        """Vacuum and analyze one partition at a time"""
+        for table, _, _ in PARTITIONED_TABLES:
+            partitions = self._execute(
+                'SELECT inhrelid::regclass::text FROM pg_inherits '
+                'WHERE inhparent = to_regclass(%s) ORDER BY 1', [table]
+            )
+            for partition, in partitions:
+                start = time.monotonic()
+                self._execute(f'VACUUM (ANALYZE) {partition}')
+                self.stdout.write(
+                    f'{partition}: vacuumed in '
+                    f'{time.monotonic() - start:.2f}s'
+                )
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connections
+
+from core.jobs import claim_job, run_job, requeue_stale_jobs, \
+                      purge_finished_jobs
+from core.models import Job
+
+
+class Command(BaseCommand):
+    """Django command to run queued background jobs"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when no job is due'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no job is due instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        self.once = options['once']
+        self.poll_interval = options['poll_interval']
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+        requeued = requeue_stale_jobs(settings.JOB_TIMEOUT)
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale jobs')
+
+        if options['concurrency'] == 1:
+            self._work()
+        else:
+            threads = [
+                threading.Thread(target=self._work, daemon=True)
+                for _ in range(options['concurrency'])
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    thread.join()
+            except KeyboardInterrupt:
+                self.once = True
+
+        for name, (count, total) in sorted(self.stats.items()):
+            self.stdout.write(
+                f'{name}: {count} runs, '
+                f'{total / count * 1000:.1f} ms average'
+            )
+
+    def _work(self):
+        next_maintenance = 0
+        try:
+            while True:
+                if time.monotonic() > next_maintenance:
+                    requeue_stale_jobs(settings.JOB_TIMEOUT)
+                    purge_finished_jobs(settings.JOB_RETENTION)
+                    next_maintenance = time.monotonic() + 60
+                job = claim_job()
+                if job is None:
+                    if self.once:
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+                waited = (job.started_at - job.run_at).total_seconds()
+                self._report(run_job(job), waited)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    def _report(self, job, waited):
+        self.stdout.write(
+            f'Job {job.id} {job.name} {job.status} in '
+            f'{job.duration * 1000:.1f} ms, waited {waited * 1000:.1f} ms '
+            f'(attempt {job.attempts}/{job.max_attempts})'
+        )
+        if job.status == Job.DONE:
+            with self.stats_lock:
+                count, total = self.stats.get(job.name, (0, 0.0))
+                self.stats[job.name] = (count + 1, total + job.duration)
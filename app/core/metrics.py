@@ -0,0 +1,313 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+# Bytes of the file holding entries, then per entry the key length, the
+# key padded to keep the value 8 byte aligned, and the value
+HEADER = struct.Struct('=Q')
+KEY_LENGTH = struct.Struct('=I')
+VALUE = struct.Struct('=d')
+INITIAL_SIZE = 64 * 1024
+
+
+def _entry_layout(key_length):
+    """Return the padded key length and total size of an entry"""
+    padded = key_length + (-(KEY_LENGTH.size + key_length) % 8)
+    return padded, KEY_LENGTH.size + padded + VALUE.size
+
+
+def read_values(data):
+    """Yield (key, value) pairs from the bytes of a values file"""
+    used = HEADER.unpack_from(data, 0)[0] if len(data) >= HEADER.size else 0
+    offset = HEADER.size
+    while offset < used:
+        length, = KEY_LENGTH.unpack_from(data, offset)
+        padded, size = _entry_layout(length)
+        start = offset + KEY_LENGTH.size
+        key = bytes(data[start:start + length]).decode()
+        value, = VALUE.unpack_from(data, start + padded)
+        yield key, value
+        offset += size
+
+
+class MmapedValues:
+    """Float values by key in a memory mapped file of one process
+
+    Only the owning process writes, so a thread lock is enough. Entries
+    are appended before the used size in the header covers them and
+    values are aligned, so readers in other processes never see a torn
+    entry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = os.fstat(self._fd).st_size
+        if size < INITIAL_SIZE:
+            os.ftruncate(self._fd, INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self._map = mmap.mmap(self._fd, size)
+        # Values are aligned doubles, updated in place by index
+        self._doubles = memoryview(self._map).cast('d')
+        self._used = HEADER.unpack_from(self._map, 0)[0] or HEADER.size
+        self._indexes = {}
+        offset = HEADER.size
+        for key, _ in read_values(self._map):
+            padded, entry_size = _entry_layout(len(key.encode()))
+            self._indexes[key] = (offset + KEY_LENGTH.size + padded) // 8
+            offset += entry_size
+
+    def add(self, items):
+        """Add each (key, amount) of items to its value"""
+        with self._lock:
+            indexes = self._indexes
+            for key, amount in items:
+                index = indexes.get(key)
+                if index is None:
+                    index = self._append(key)
+                self._doubles[index] += amount
+
+    def _append(self, key):
+        encoded = key.encode()
+        padded, size = _entry_layout(len(encoded))
+        if self._used + size > len(self._map):
+            new_size = len(self._map)
+            while self._used + size > new_size:
+                new_size *= 2
+            os.ftruncate(self._fd, new_size)
+            self._doubles.release()
+            self._map.close()
+            self._map = mmap.mmap(self._fd, new_size)
+            self._doubles = memoryview(self._map).cast('d')
+
+        offset = self._used
+        KEY_LENGTH.pack_into(self._map, offset, len(encoded))
+        start = offset + KEY_LENGTH.size
+        self._map[start:start + len(encoded)] = encoded
+        VALUE.pack_into(self._map, start + padded, 0.0)
+        self._used += size
+        HEADER.pack_into(self._map, 0, self._used)
+        index = self._indexes[key] = (start + padded) // 8
+        return index
+
+
+_values = None
+_values_lock = threading.Lock()
+
+
+def get_values():
+    """Return the values file of this process in METRICS_DIR"""
+    global _values
+    values = _values
+    pid = os.getpid()
+    directory = settings.METRICS_DIR
+    if values is None or values.pid != pid or values.directory != directory:
+        with _values_lock:
+            os.makedirs(directory, exist_ok=True)
+            values = MmapedValues(os.path.join(directory, f'{pid}.db'))
+            values.pid = pid
+            values.directory = directory
+            _values = values
+    return values
+
+
+class Metric:
+    """A named metric whose samples are keyed by label values"""
+    type = None
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._keys = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels, suffix='', bucket=None):
+        return json.dumps([self.name, suffix, list(labels), bucket])
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+    type = 'counter'
+
+    def items(self, labels, amount=1):
+        """Return the (key, amount) updates counting amount"""
+        key = self._keys.get(labels)
+        if key is None:
+            key = self._keys[labels] = self._key(labels)
+        return ((key, amount),)
+
+    def inc(self, labels, amount=1):
+        get_values().add(self.items(labels, amount))
+
+
+class Histogram(Metric):
+    """Counts of observations falling in each bucket, plus their sum"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def items(self, labels, value):
+        """Return the (key, amount) updates observing value"""
+        keys = self._keys.get(labels)
+        if keys is None:
+            keys = self._keys[labels] = (
+                [self._key(labels, '_bucket', b) for b in self.buckets],
+                self._key(labels, '_sum'),
+                self._key(labels, '_count')
+            )
+        buckets, sum_key, count_key = keys
+        return (
+            (buckets[bisect_left(self.buckets, value)], 1),
+            (sum_key, value),
+            (count_key, 1),
+        )
+
+    def observe(self, labels, value):
+        get_values().add(self.items(labels, value))
+
+
+REGISTRY = []
+# Other methods are recorded as 'other' so clients cannot add label values
+METHODS = frozenset(
+    ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+)
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Time to respond to a request',
+    ('route', 'method'),
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    'Size of response bodies',
+    ('route', 'method'),
+    (100, 1000, 10000, 100000, 1000000, 10000000)
+)
+SQL_DURATION = Counter(
+    'http_request_sql_seconds_total',
+    'Time spent running SQL for requests',
+    ('route',)
+)
+SQL_QUERIES = Counter(
+    'http_request_sql_queries_total',
+    'SQL queries run for requests',
+    ('route',)
+)
+CACHE_REQUESTS = Counter(
+    'app_cache_requests_total',
+    'Lookups in application caches by result',
+    ('cache', 'result')
+)
+ACCESS_LOG_DROPPED = Counter(
+    'access_log_dropped_total',
+    'Access log records dropped because the writer fell behind',
+    ()
+)
+
+
+def record_request(route, method, duration, queries, sql_duration, size):
+    """Record the metrics of one served request in a single update"""
+    labels = (route, method if method in METHODS else 'other')
+    items = REQUEST_DURATION.items(labels, duration)
+    if size is not None:
+        items += RESPONSE_SIZE.items(labels, size)
+    if queries:
+        items += SQL_QUERIES.items((route,), queries)
+        items += SQL_DURATION.items((route,), sql_duration)
+    get_values().add(items)
+
+
+def record_cache(cache, hit, count=1):
+    """Count hits or misses of an application cache"""
+    if count:
+        CACHE_REQUESTS.inc((cache, 'hit' if hit else 'miss'), count)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(names, values):
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}' if pairs else ''
+
+
+def _format_sample(name, labelnames, labels, value):
+    return f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}'
+
+
+def collect():
+    """Return every metric summed over all processes, in text format"""
+    totals = defaultdict(float)
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    with os.scandir(settings.METRICS_DIR) as it:
+        for entry in it:
+            if not entry.name.endswith('.db'):
+                continue
+            with open(entry.path, 'rb') as values_file:
+                data = values_file.read()
+            for key, value in read_values(data):
+                totals[key] += value
+
+    samples = defaultdict(list)
+    for key, value in totals.items():
+        name, suffix, labels, bucket = json.loads(key)
+        samples[name].append((suffix, tuple(labels), bucket, value))
+
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        rows = defaultdict(dict)
+        for suffix, labels, bucket, value in samples.get(metric.name, ()):
+            rows[labels][suffix, bucket] = value
+        for labels, values in sorted(rows.items()):
+            if isinstance(metric, Histogram):
+                # Export every bucket, even those no process has written
+                cumulative = 0.0
+                for bucket in metric.buckets:
+                    cumulative += values.get(('_bucket', bucket), 0.0)
+                    lines.append(_format_sample(
+                        metric.name + '_bucket',
+                        metric.labelnames + ('le',),
+                        labels + (_format_value(bucket),),
+                        cumulative
+                    ))
+                suffixes = ('_sum', '_count')
+            else:
+                suffixes = ('',)
+            for suffix in suffixes:
+                lines.append(_format_sample(
+                    metric.name + suffix, metric.labelnames, labels,
+                    values.get((suffix, None), 0.0)
+                ))
+
+    lines.append('# HELP app_cache_hit_ratio Share of cache lookups that hit')
+    lines.append('# TYPE app_cache_hit_ratio gauge')
+    lookups = defaultdict(lambda: [0.0, 0.0])
+    for suffix, (cache, result), _, value in samples.get(
+        CACHE_REQUESTS.name, ()
+    ):
+        lookups[cache][result == 'hit'] += value
+    for cache, (misses, hits) in sorted(lookups.items()):
+        lines.append(_format_sample(
+            'app_cache_hit_ratio', ('cache',), (cache,), hits / (hits + misses)
+        ))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,272 @@
+import hashlib
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+
+from core.accesslog import get_writer
+from core.authentication import CachedTokenAuthentication
+from core.metrics import record_request
+from core.profiling import profile_view
+from core.routers import read_from_replica, reset_read_from_replica
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PROFILE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def _pin_key(request, response=None):
+    """Return the cache key pinning this client to the primary
+
+    Clients are told apart by their Authorization header, or by their
+    session cookie without one, taking the session a response starts
+    (as on login) over the one the request came with.
+    """
+    credentials = request.META.get('HTTP_AUTHORIZATION')
+    if not credentials:
+        session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if response is not None and \
+                settings.SESSION_COOKIE_NAME in response.cookies:
+            session = response.cookies[settings.SESSION_COOKIE_NAME].value
+        if not session:
+            return None
+        credentials = f'session {session}'
+    digest = hashlib.sha1(credentials.encode()).hexdigest()
+    return f'replica:pin:{digest}'
+
+
+class ReplicaRoutingMiddleware:
+    """Route safe API requests to read replicas
+
+    Clients stick to the primary for REPLICA_PIN_SECONDS after a successful
+    write so they always read their own writes, whether they authenticate
+    with a token or a session.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = read_from_replica(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_read_from_replica(token)
+
+        key = _pin_key(request, response)
+        if key and request.method not in SAFE_METHODS and \
+                response.status_code < 400:
+            cache.set(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DATABASE_REPLICAS or \
+                request.method not in SAFE_METHODS:
+            return None
+        view_class = getattr(view_func, 'cls', view_func)
+        if view_class.__module__ not in settings.REPLICA_VIEW_MODULES:
+            return None
+        key = _pin_key(request)
+        if key is None or not cache.get(key):
+            read_from_replica(True)
+        return None
+
+
+class RateLimitHeadersMiddleware:
+    """Add RateLimit headers for requests checked by TokenBucketThrottle"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            limit, remaining, reset = rate_limit
+            response['RateLimit-Limit'] = limit
+            response['RateLimit-Remaining'] = remaining
+            response['RateLimit-Reset'] = reset
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile API requests of staff users that ask for it
+
+    A request is profiled when it sends X-Profile: 1 or ?profile=1 to a
+    view in PROFILE_VIEW_MODULES. Other requests only pay for the check
+    of the header and query string.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        value = request.META.get('HTTP_X_PROFILE') or \
+            request.GET.get('profile')
+        if not value or value.lower() not in PROFILE_VALUES:
+            return None
+        view_class = getattr(view_func, 'cls', view_func)
+        if view_class.__module__ not in settings.PROFILE_VIEW_MODULES or \
+                not self._is_staff(request):
+            return None
+        return profile_view(request, view_func, view_args, view_kwargs)
+
+    def _is_staff(self, request):
+        # request.user is missing on paths skipping the session stack
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        try:
+            auth = CachedTokenAuthentication().authenticate(Request(request))
+        except AuthenticationFailed:
+            return False
+        return auth is not None and auth[0].is_staff
+
+
+class QueryStats:
+    """Count the queries run and the seconds spent running them"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+@contextmanager
+def query_stats(request):
+    """Count the queries of request, wrapping the connections only once
+
+    Middleware nested in one that already counts share its QueryStats.
+    """
+    stats = getattr(request, 'query_stats', None)
+    if stats is not None:
+        yield stats
+        return
+    stats = request.query_stats = QueryStats()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+class MetricsMiddleware:
+    """Record latency, SQL and response size metrics of every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with query_stats(request) as sql:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        if response.streaming:
+            size = response.get('Content-Length')
+            size = int(size) if size else None
+        else:
+            size = len(response.content)
+        record_request(
+            match.view_name if match else 'unmatched',
+            request.method, duration, sql.count, sql.seconds, size
+        )
+        return response
+
+
+class AccessLogMiddleware:
+    """Log requests as JSON lines without writing on the request thread
+
+    Errors are always logged, other requests are sampled at
+    ACCESS_LOG_SAMPLE_RATE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.ACCESS_LOG_PATH is None:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with query_stats(request) as sql:
+            queries = sql.count
+            response = self.get_response(request)
+            queries = sql.count - queries
+        duration = time.perf_counter() - start
+
+        status = response.status_code
+        if status < 400 and \
+                random.random() >= settings.ACCESS_LOG_SAMPLE_RATE:
+            return response
+        # DRF stores the user it authenticated on the Django request
+        user = getattr(request, 'user', None)
+        match = request.resolver_match
+        get_writer().put((
+            time.time(),
+            user.pk if user is not None and user.is_authenticated else None,
+            request.method,
+            match.view_name if match else 'unmatched',
+            status,
+            duration,
+            queries
+        ))
+        return response
+
+
+class SessionStackMiddleware:
+    """Run SESSION_STACK_MIDDLEWARE except on SESSION_STACK_EXEMPT_PATHS
+
+    Token authenticated API clients have no use for sessions, CSRF checks,
+    messages or request.user, so their paths skip those middleware while
+    the admin and other pages keep them. Only the request, response and
+    process_view hooks of the wrapped middleware are supported.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        handler = get_response
+        self._view_middleware = []
+        for path in reversed(settings.SESSION_STACK_MIDDLEWARE):
+            middleware = import_string(path)(handler)
+            if hasattr(middleware, 'process_view'):
+                self._view_middleware.insert(0, middleware.process_view)
+            handler = convert_exception_to_response(middleware)
+        self.session_stack = handler
+
+    def _exempt(self, request):
+        return request.path_info.startswith(
+            settings.SESSION_STACK_EXEMPT_PATHS
+        )
+
+    def __call__(self, request):
+        if self._exempt(request):
+            return self.get_response(request)
+        return self.session_stack(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self._exempt(request):
+            return None
+        for process_view in self._view_middleware:
+            response = process_view(request, view_func, view_args,
+                                    view_kwargs)
+            if response is not None:
+                return response
+        return None
@@ -0,0 +1,35 @@
+# Generated by Django 3.2 on 2026-10-19 12:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_ingredients(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    counts = Recipe.ingredients.through.objects.filter(
+        recipe_id=OuterRef('pk')
+    ).order_by().values('recipe_id').annotate(
+        count=Count('*')
+    ).values('count')
+    Recipe.objects.update(ingredient_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'ingredient_count'], name='core_recipe_user_id_d99a00_idx'),
+        ),
+        migrations.RunPython(count_ingredients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.2 on 2026-10-19 13:40
+
+from django.db import migrations
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Lower
+
+
+def merge_duplicates(apps, model_name, field_name):
+    """Point recipes at the oldest of each user's same named objects"""
+    Model = apps.get_model('core', model_name)
+    Recipe = apps.get_model('core', 'Recipe')
+    Through = getattr(Recipe, field_name).through
+    column = f'{model_name.lower()}_id'
+
+    duplicates = Model.objects.annotate(lower_name=Lower('name')).values(
+        'user_id', 'lower_name'
+    ).annotate(keep=Min('id'), count=Count('id')).filter(count__gt=1)
+    for group in duplicates:
+        merged = list(Model.objects.annotate(
+            lower_name=Lower('name')
+        ).filter(
+            user_id=group['user_id'], lower_name=group['lower_name']
+        ).exclude(id=group['keep']).values_list('id', flat=True))
+        recipe_ids = set(Through.objects.filter(
+            **{f'{column}__in': merged}
+        ).values_list('recipe_id', flat=True))
+        recipe_ids -= set(Through.objects.filter(
+            **{column: group['keep']}
+        ).values_list('recipe_id', flat=True))
+        Through.objects.bulk_create([
+            Through(recipe_id=recipe_id, **{column: group['keep']})
+            for recipe_id in recipe_ids
+        ])
+        Model.objects.filter(id__in=merged).delete()
+
+
+def merge_duplicate_names(apps, schema_editor):
+    merge_duplicates(apps, 'Tag', 'tags')
+    merge_duplicates(apps, 'Ingredient', 'ingredients')
+
+    Recipe = apps.get_model('core', 'Recipe')
+    counts = Recipe.ingredients.through.objects.filter(
+        recipe_id=OuterRef('pk')
+    ).order_by().values('recipe_id').annotate(
+        count=Count('*')
+    ).values('count')
+    Recipe.objects.update(ingredient_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_name_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_tag_user_lower_name_uniq '
+            'ON core_tag (user_id, LOWER(name))',
+            'DROP INDEX core_tag_user_lower_name_uniq',
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_ingredient_user_lower_name_uniq '
+            'ON core_ingredient (user_id, LOWER(name))',
+            'DROP INDEX core_ingredient_user_lower_name_uniq',
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.2 on 2026-10-19 14:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def record_existing(apps, schema_editor):
+    """Log every existing object so that since=0 returns everything"""
+    Change = apps.get_model('core', 'Change')
+    SyncSequence = apps.get_model('core', 'SyncSequence')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    for user_id in User.objects.values_list('id', flat=True).iterator():
+        changes = []
+        for model_name in ('recipe', 'tag', 'ingredient'):
+            Model = apps.get_model('core', model_name)
+            changes += [
+                Change(
+                    user_id=user_id,
+                    seq=len(changes) + i,
+                    model=model_name,
+                    object_id=object_id
+                )
+                for i, object_id in enumerate(Model.objects.filter(
+                    user_id=user_id
+                ).order_by('id').values_list('id', flat=True), 1)
+            ]
+        Change.objects.bulk_create(changes, batch_size=1000)
+        SyncSequence.objects.create(user_id=user_id, seq=len(changes))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_unique_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField(default=0)),
+                ('compacted_seq', models.BigIntegerField(default=0)),
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField()),
+                ('model', models.CharField(choices=[('recipe', 'Recipe'), ('tag', 'Tag'), ('ingredient', 'Ingredient')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'seq'], name='core_change_user_id_b07c4f_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='change',
+            constraint=models.UniqueConstraint(fields=('user', 'model', 'object_id'), name='core_change_user_object_uniq'),
+        ),
+        migrations.RunPython(record_existing, migrations.RunPython.noop),
+    ]
@@ -4,6 +4,10 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
+from django.db.models.fields.files import ImageFieldFile
+from django.utils import timezone
+
+from core.storage import RecipeImageStorage
 
 
 def recipe_image_file_path(instance, filename):
@@ -13,6 +17,19 @@ def recipe_image_file_path(instance, filename):
     return os.path.join('uploads/recipe', filename)
 
 
+class RecipeImageFieldFile(ImageFieldFile):
+
+    def save(self, name, content, save=True):
+        """Save the file, remembering that the storage took a reference"""
+        self.instance._new_image_reference = True
+        super().save(name, content, save)
+
+
+class RecipeImageField(models.ImageField):
+    """Image field that tracks uploads for reference counted storage"""
+    attr_class = RecipeImageFieldFile
+
+
 class UserManager(BaseUserManager):
 
     def create_user(self, email, password=None, **extra_fields):
@@ -86,7 +103,135 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = RecipeImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=RecipeImageStorage()
+    )
+    pending_deletion = models.BooleanField(default=False)
+    # Maintained by core.signals for the pantry query
+    ingredient_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'ingredient_count']),
+            # Keyset friendly orderings of the recipe list
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'price', 'id']),
+            models.Index(fields=['user', 'time_minutes', 'id']),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class StoredImage(models.Model):
+    """Reference count of a content addressed recipe image"""
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class PendingDeletion(models.Model):
+    """Recipes or a whole user waiting to be deleted in batches"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    delete_user = models.BooleanField(default=False)
+    deleted_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Pending deletion for user {self.user_id}'
+
+
+class Job(models.Model):
+    """Background job run by the run_worker command"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    duration = models.FloatField(null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'])]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class SyncSequence(models.Model):
+    """Last change sequence number handed out for a user
+
+    Rows are removed with the user by core.signals rather than by a
+    cascade, because the user's deleted objects still record changes.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False
+    )
+    seq = models.BigIntegerField(default=0)
+    # Changes up to this sequence may have been compacted away
+    compacted_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'Sync sequence {self.seq} for user {self.user_id}'
+
+
+class Change(models.Model):
+    """Latest change of a synced object, a tombstone once deleted"""
+    RECIPE = 'recipe'
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    MODEL_CHOICES = (
+        (RECIPE, 'Recipe'),
+        (TAG, 'Tag'),
+        (INGREDIENT, 'Ingredient'),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False
+    )
+    seq = models.BigIntegerField()
+    model = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'model', 'object_id'],
+                name='core_change_user_object_uniq'
+            ),
+        ]
+        indexes = [models.Index(fields=['user', 'seq'])]
+
+    def __str__(self):
+        return f'{self.model} {self.object_id} at {self.seq}'
@@ -0,0 +1,86 @@
+import cProfile
+import json
+import os
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+def profile_path(profile_id, kind):
+    """Return the path of a stored profile, kind is 'prof' or 'json'"""
+    return os.path.join(settings.PROFILE_DIR, f'{profile_id}.{kind}')
+
+
+def _trim_profiles():
+    """Keep only the PROFILE_MAX_COUNT newest profiles"""
+    with os.scandir(settings.PROFILE_DIR) as it:
+        entries = sorted(
+            (entry.stat().st_mtime, entry.path) for entry in it
+            if entry.name.endswith('.json')
+        )
+    for _, path in entries[:-settings.PROFILE_MAX_COUNT or None]:
+        for stale in (path, path[:-len('json')] + 'prof'):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def profile_view(request, view_func, view_args, view_kwargs):
+    """Run a view under cProfile, capturing its SQL on every database
+
+    The pstats dump and a JSON report of the queries are stored in
+    PROFILE_DIR under the id returned in the X-Profile-Id header. Query
+    parameters such as tokens are left out of the report, only their
+    number is kept.
+    """
+    queries = []
+
+    def record(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            queries.append({
+                'database': context['connection'].alias,
+                'sql': sql,
+                'param_count': len(params) if params else 0,
+                'many': many,
+                'duration': time.perf_counter() - start
+            })
+
+    profiler = cProfile.Profile()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(record))
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = view_func(request, *view_args, **view_kwargs)
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+
+    profile_id = uuid.uuid4().hex
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(profile_path(profile_id, 'prof'))
+    with open(profile_path(profile_id, 'json'), 'w') as report:
+        json.dump({
+            'id': profile_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': request.user.pk,
+            'status': response.status_code,
+            'duration': duration,
+            'sql_duration': sum(q['duration'] for q in queries),
+            'queries': queries
+        }, report, indent=2)
+    _trim_profiles()
+
+    response['X-Profile-Id'] = profile_id
+    return response
@@ -0,0 +1,64 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.utils import OperationalError
+
+# Set by ReplicaRoutingMiddleware for the requests that may read from a
+# replica; everything else, including management commands, uses the primary
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+# Authentication lookups always go to the primary so that freshly issued
+# tokens and new users are usable immediately
+PRIMARY_ONLY_APPS = ('authtoken', 'sessions')
+
+_unhealthy_until = {}
+
+
+def read_from_replica(enabled):
+    """Allow or disallow replica reads in the current context"""
+    return _read_from_replica.set(enabled)
+
+
+def reset_read_from_replica(token):
+    """Restore replica reads to the state before read_from_replica"""
+    _read_from_replica.reset(token)
+
+
+def _is_healthy(alias):
+    """Return whether a replica connection can be used"""
+    if _unhealthy_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except OperationalError:
+        _unhealthy_until[alias] = (
+            time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        )
+        return False
+    _unhealthy_until.pop(alias, None)
+    return True
+
+
+class ReplicaRouter:
+    """Send reads to a healthy replica when the request allows it"""
+
+    def db_for_read(self, model, **hints):
+        if not _read_from_replica.get() or \
+                model._meta.app_label in PRIMARY_ONLY_APPS:
+            return 'default'
+        replicas = list(settings.DATABASE_REPLICAS)
+        random.shuffle(replicas)
+        for alias in replicas:
+            if _is_healthy(alias):
+                return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
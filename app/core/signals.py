@@ -0,0 +1,144 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save, post_save, pre_delete, \
+                                     post_delete, m2m_changed
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from core.authentication import forget_token
+from core.models import Recipe, Tag, Ingredient, Change, SyncSequence
+from core.storage import is_content_addressed
+from core.sync import record_changes
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous_image(sender, instance, **kwargs):
+    """Keep the stored image name so a replaced image can be released"""
+    if not is_content_addressed() or instance.pk is None:
+        return
+    instance._previous_image = Recipe.objects.filter(
+        pk=instance.pk
+    ).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def release_replaced_image(sender, instance, **kwargs):
+    """Release the reference held by an image that was replaced"""
+    previous = instance.__dict__.pop('_previous_image', None)
+    new_reference = instance.__dict__.pop('_new_image_reference', False)
+    if previous and (new_reference or previous != instance.image.name):
+        instance.image.storage.release(previous)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, **kwargs):
+    """Release the reference held by a deleted recipe's image"""
+    if is_content_addressed() and instance.image:
+        instance.image.storage.release(instance.image.name)
+
+
+def update_ingredient_counts(recipe_ids):
+    """Recount the ingredients of the given recipes"""
+    counts = Recipe.ingredients.through.objects.filter(
+        recipe_id=OuterRef('pk')
+    ).order_by().values('recipe_id').annotate(
+        count=Count('*')
+    ).values('count')
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        ingredient_count=Coalesce(Subquery(counts), 0)
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_links_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    """Recount ingredients and record the change of the recipes"""
+    if reverse and action == 'pre_clear':
+        instance._cleared_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = instance.__dict__.pop('_cleared_recipe_ids', [])
+    else:
+        recipe_ids = list(pk_set)
+
+    if sender is Recipe.ingredients.through:
+        update_ingredient_counts(recipe_ids)
+        if not reverse:
+            instance.ingredient_count = Recipe.objects.filter(
+                pk=instance.pk
+            ).values_list('ingredient_count', flat=True).get()
+    record_changes(instance.user_id, Change.RECIPE, recipe_ids)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_attribute_recipes(sender, instance, **kwargs):
+    """Keep the recipes of a deleted tag or ingredient"""
+    instance._recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def attribute_deleted(sender, instance, **kwargs):
+    """Recount and record the recipes that used a tag or ingredient"""
+    recipe_ids = instance.__dict__.pop('_recipe_ids', [])
+    if sender is Ingredient:
+        update_ingredient_counts(recipe_ids)
+    record_changes(instance.user_id, Change.RECIPE, recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def record_saved(sender, instance, **kwargs):
+    """Record the change of a synced object"""
+    record_changes(
+        instance.user_id, sender._meta.model_name, [instance.pk]
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def record_deleted(sender, instance, **kwargs):
+    """Leave a tombstone for a deleted synced object"""
+    record_changes(
+        instance.user_id, sender._meta.model_name, [instance.pk],
+        deleted=True
+    )
+
+
+@receiver(post_delete, sender=get_user_model())
+def delete_sync_state(sender, instance, **kwargs):
+    """Drop the change log of a deleted user"""
+    Change.objects.filter(user_id=instance.pk).delete()
+    SyncSequence.objects.filter(user_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    """Drop a changed or deleted token from the tokens cache"""
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_changed(sender, instance, created, **kwargs):
+    """Drop the cached token of a changed user"""
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ):
+        forget_token(key)
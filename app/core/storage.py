@@ -0,0 +1,117 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+def is_content_addressed():
+    """Return whether recipe images are stored by content digest"""
+    return settings.RECIPE_IMAGE_STORAGE == 'content'
+
+
+@deconstructible
+class RecipeImageStorage(FileSystemStorage):
+    """File system storage for recipe images
+
+    When RECIPE_IMAGE_STORAGE is 'content' each upload is stored under the
+    SHA-256 digest of its bytes and reference counted through StoredImage,
+    so identical uploads share a single file on disk.
+    """
+
+    def _save(self, name, content):
+        if not is_content_addressed():
+            return super()._save(name, content)
+
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        temp_path = None
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk, hash it and move it into place only if new
+            sha256 = hashlib.sha256()
+            for chunk in content.chunks():
+                sha256.update(chunk)
+            digest = sha256.hexdigest()
+        else:
+            digest, temp_path = self._write_temporary(directory, content)
+
+        name = posixpath.join(directory, digest + extension)
+        try:
+            with transaction.atomic():
+                stored_image = self._lock(name, create=True)
+                try:
+                    # Restart the grace period of collect_media_garbage,
+                    # which may have found the file unreferenced
+                    os.utime(self.path(name))
+                except FileNotFoundError:
+                    if temp_path is not None:
+                        os.replace(temp_path, self.path(name))
+                        temp_path = None
+                    else:
+                        super()._save(name, content)
+                self._stored_images().filter(pk=stored_image.pk).update(
+                    ref_count=F('ref_count') + 1
+                )
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+        return name
+
+    def _write_temporary(self, directory, content):
+        """Stream content to a temporary file, returning digest and path"""
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+        sha256 = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=full_directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    temp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            else:
+                # mkstemp creates the file readable by the owner only
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(temp_path, 0o666 & ~umask)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return sha256.hexdigest(), temp_path
+
+    def _stored_images(self):
+        return apps.get_model('core', 'StoredImage').objects
+
+    def _lock(self, name, create=False):
+        """Return the StoredImage row for name locked for update"""
+        queryset = self._stored_images().select_for_update()
+        if create:
+            return queryset.get_or_create(name=name)[0]
+        return queryset.filter(name=name).first()
+
+    def release(self, name):
+        """Drop one reference to name, deleting the file with the last"""
+        with transaction.atomic():
+            stored_image = self._lock(name)
+            if stored_image is None:
+                return
+            if stored_image.ref_count > 1:
+                self._stored_images().filter(pk=stored_image.pk).update(
+                    ref_count=F('ref_count') - 1
+                )
+                return
+            stored_image.delete()
+            # Keep the file until the release commits, and in case an
+            # upload of the same image referenced it again meanwhile
+            transaction.on_commit(lambda: self._delete_unreferenced(name))
+
+    def _delete_unreferenced(self, name):
+        if not self._stored_images().filter(name=name).exists():
+            self.delete(name)
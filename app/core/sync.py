@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.events import publish_change
+from core.models import Change, SyncSequence
+
+
+def record_changes(user_id, model, object_ids, deleted=False):
+    """Give the objects the next sequence numbers of their user
+
+    The user's SyncSequence row stays locked until the transaction
+    commits, so a user's changes become visible in sequence order and a
+    client that has seen a number never misses an earlier one.
+    """
+    object_ids = list(dict.fromkeys(object_ids))
+    if not object_ids:
+        return
+    with transaction.atomic(savepoint=False):
+        sequence, _ = SyncSequence.objects.select_for_update().get_or_create(
+            user_id=user_id
+        )
+        start = sequence.seq
+        sequence.seq += len(object_ids)
+        sequence.save(update_fields=['seq'])
+
+        Change.objects.filter(
+            user_id=user_id, model=model, object_id__in=object_ids
+        ).delete()
+        Change.objects.bulk_create([
+            Change(
+                user_id=user_id,
+                seq=start + i,
+                model=model,
+                object_id=object_id,
+                deleted=deleted
+            )
+            for i, object_id in enumerate(object_ids, 1)
+        ])
+        publish_change(user_id, sequence.seq, model, object_ids, deleted)
+
+
+def compact_tombstones(age):
+    """Delete tombstones older than age seconds, returning how many
+
+    Clients that synced before the newest compacted tombstone are told
+    to start again from scratch.
+    """
+    tombstones = Change.objects.filter(
+        deleted=True, changed__lt=timezone.now() - timedelta(seconds=age)
+    )
+    total = 0
+    for row in tombstones.values('user_id').annotate(last=Max('seq')):
+        with transaction.atomic():
+            SyncSequence.objects.filter(user_id=row['user_id']).update(
+                compacted_seq=row['last']
+            )
+            total += tombstones.filter(
+                user_id=row['user_id'], seq__lte=row['last']
+            ).delete()[0]
+    return total
@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import accesslog, metrics
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class AccessLogTests(TestCase):
+    """Test the JSON lines access log"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'access.log')
+        log_settings = override_settings(ACCESS_LOG_PATH=self.path)
+        log_settings.enable()
+        self.addCleanup(log_settings.disable)
+        self.addCleanup(accesslog.close_writer)
+
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepass'
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+    def read_log(self):
+        accesslog.get_writer().flush()
+        with open(self.path) as log_file:
+            return [json.loads(line) for line in log_file]
+
+    def test_request_logged(self):
+        """Test the user, route, status and query count are logged"""
+        self.client.get(RECIPE_URL)
+
+        records = self.read_log()
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['user'], self.user.pk)
+        self.assertEqual(records[0]['route'], 'recipe:recipe-list')
+        self.assertEqual(records[0]['method'], 'GET')
+        self.assertEqual(records[0]['status'], 200)
+        self.assertGreater(records[0]['queries'], 0)
+        self.assertIn('ms', records[0])
+
+    def test_queries_counted_once(self):
+        """Test the access log shares the query counter of the metrics"""
+        with mock.patch.object(
+            BaseDatabaseWrapper, 'execute_wrapper', autospec=True,
+            side_effect=BaseDatabaseWrapper.execute_wrapper
+        ) as execute_wrapper:
+            self.client.get(RECIPE_URL)
+
+        self.assertEqual(execute_wrapper.call_count, len(connections.all()))
+        self.assertGreater(self.read_log()[0]['queries'], 0)
+
+    @override_settings(ACCESS_LOG_SAMPLE_RATE=0)
+    def test_errors_not_sampled(self):
+        """Test sampling drops successes but keeps errors"""
+        self.client.get(RECIPE_URL)
+        self.client.get('/api/missing/')
+
+        records = self.read_log()
+
+        self.assertEqual([r['status'] for r in records], [404])
+        self.assertEqual(records[0]['route'], 'unmatched')
+
+
+class AccessLogWriterTests(SimpleTestCase):
+    """Test the background access log writer"""
+
+    def test_full_queue_drops(self):
+        """Test records are dropped and counted instead of blocking"""
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory):
+            writer = accesslog.AccessLogWriter(
+                os.path.join(directory, 'access.log'), 1, 10
+            )
+            for _ in range(3):
+                writer.put((0, None, 'GET', 'route', 200, 0.01, 1))
+
+            self.assertEqual(writer.queue.qsize(), 1)
+            self.assertIn('access_log_dropped_total 2\n', metrics.collect())
+
+    def test_close_unopenable_log(self):
+        """Test closing does not hang when the log cannot be opened"""
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory):
+            writer = accesslog.AccessLogWriter(
+                os.path.join(directory, 'missing', 'access.log'), 1, 10
+            )
+            with self.assertLogs('core.accesslog', 'ERROR'):
+                writer.start()
+                writer.join(5)
+            for _ in range(3):
+                writer.put((0, None, 'GET', 'route', 200, 0.01, 1))
+
+            closer = threading.Thread(target=writer.close)
+            closer.start()
+            closer.join(5)
+
+            self.assertFalse(closer.is_alive())
+            writer.flush()
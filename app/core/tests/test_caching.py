@@ -0,0 +1,175 @@
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import tokens
+from core.checks import check_shared_cache
+from core.caching import TieredCache
+
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+@override_settings(CACHE_LOCK_POLL_SECONDS=0.01)
+class TieredCacheTests(SimpleTestCase):
+    """Test the in process cache in front of the shared cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.cache = TieredCache('test', 60)
+        self.calls = 0
+
+    def compute(self, value='value', delay=0):
+        def compute():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+
+    def test_get_computes_once(self):
+        """Test values come from the process, then from the shared cache"""
+        self.assertEqual(self.cache.get('key', self.compute()), 'value')
+        self.assertEqual(self.cache.get('key', self.compute()), 'value')
+        self.cache.clear_local()
+        self.assertEqual(self.cache.get('key', self.compute()), 'value')
+
+        self.assertEqual(self.calls, 1)
+
+    def test_none_cached(self):
+        """Test a computed None is cached like any other value"""
+        self.cache.get('key', self.compute(None))
+        self.assertIsNone(self.cache.get('key', self.compute()))
+
+        self.assertEqual(self.calls, 1)
+
+    def test_delete(self):
+        """Test deleting a key recomputes it"""
+        self.cache.get('key', self.compute())
+        self.cache.delete('key')
+
+        self.assertEqual(self.cache.get('key', self.compute('new')), 'new')
+
+    def test_concurrent_misses_coalesce(self):
+        """Test only one caller computes a missing key"""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.cache.get('key', self.compute(delay=0.1))
+            ))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['value'] * 4)
+        self.assertEqual(self.calls, 1)
+
+    @mock.patch('core.caching.random.random', return_value=0.5)
+    def test_early_expiration(self, _):
+        """Test an entry near expiry is recomputed before it expires"""
+        cache.set('test:key', ('old', 10, time.time() + 1), 60)
+
+        self.assertEqual(self.cache.get('key', self.compute('new')), 'new')
+
+    @mock.patch('core.caching.random.random', return_value=0.5)
+    def test_early_expiration_locked(self, _):
+        """Test callers keep the old value while another one refreshes"""
+        cache.set('test:key', ('old', 10, time.time() + 1), 60)
+        cache.add('test:key:lock', 1)
+
+        self.assertEqual(self.cache.get('key', self.compute('new')), 'old')
+        self.assertEqual(self.calls, 0)
+
+    def test_non_atomic_backend_warned(self):
+        """Test a shared file based cache is reported by the checks"""
+        self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/unused',
+        }}):
+            errors = check_shared_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.W001'])
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test token authentication through the tokens cache"""
+
+    def setUp(self):
+        cache.clear()
+        tokens.clear_local()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def test_token_cached(self):
+        """Test the token is only looked up once"""
+        self.client.get(TAGS_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            [q for q in queries if 'authtoken_token' in q['sql']]
+        )
+
+    def test_password_not_cached(self):
+        """Test only flags of the user are cached, the rest is deferred"""
+        self.client.get(ME_URL)
+        entry = cache.get(f'tokens:{self.token.key}')
+
+        self.assertEqual(entry[0], (self.user.id, True, False, False))
+        res = self.client.patch(ME_URL, {'name': 'Ratnakar'})
+        self.assertEqual(res.data['email'], self.user.email)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Ratnakar')
+        self.assertTrue(self.user.check_password('simplepass'))
+
+    def test_stale_entry_dropped_on_commit(self):
+        """Test a token cached before the deactivation commits is dropped"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # A concurrent request reading the still committed user
+            tokens.get(self.token.key, lambda: (self.user.id, True,
+                                                False, False))
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_inactive_user_rejected(self):
+        """Test deactivating a user invalidates the cached token"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_rejected(self):
+        """Test a deleted token stops authenticating"""
+        self.client.get(ME_URL)
+        Token.objects.filter(user=self.user).delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,8 +1,20 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import skipIf, skipUnless
 from unittest.mock import patch
 
-from django.core.management import call_command
-from django.db.utils import OperationalError
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.utils import IntegrityError, OperationalError
+from django.test import TestCase, override_settings
+
+from core.models import Recipe, Tag
+
+MEDIA_ROOT = tempfile.mkdtemp()
 
 
 class CommandTest(TestCase):
@@ -21,3 +33,152 @@ class CommandTest(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CollectMediaGarbageTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.directory = os.path.join(MEDIA_ROOT, 'uploads/recipe')
+        os.makedirs(self.directory, exist_ok=True)
+        user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepassword'
+        )
+        Recipe.objects.create(
+            user=user, title='Curry', time_minutes=5, price=5.0,
+            image='uploads/recipe/referenced.jpg'
+        )
+        self.old = time.time() - 2 * 24 * 60 * 60
+        self.referenced = self._create_file('referenced.jpg', self.old)
+        self.orphaned = self._create_file('orphaned.jpg', self.old)
+        self.recent = self._create_file('recent.jpg')
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+    def _create_file(self, name, mtime=None):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(b'image')
+        if mtime:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_collect_orphaned_files(self):
+        """Test only old unreferenced files are deleted"""
+        call_command(
+            'collect_media_garbage', '--batch-size=1', stdout=StringIO()
+        )
+
+        self.assertTrue(os.path.exists(self.referenced))
+        self.assertTrue(os.path.exists(self.recent))
+        self.assertFalse(os.path.exists(self.orphaned))
+
+    def test_collect_skips_file_reused_meanwhile(self):
+        """Test a file touched after its batch was checked is kept"""
+        with patch(
+            'core.management.commands.collect_media_garbage.Command.'
+            '_throttle', autospec=True,
+            side_effect=lambda command: os.utime(self.orphaned)
+        ):
+            call_command('collect_media_garbage', stdout=StringIO())
+
+        self.assertTrue(os.path.exists(self.orphaned))
+
+    def test_collect_dry_run(self):
+        """Test dry run reports orphaned files without deleting them"""
+        out = StringIO()
+        call_command('collect_media_garbage', '--dry-run', stdout=out)
+
+        self.assertTrue(os.path.exists(self.orphaned))
+        self.assertIn('uploads/recipe/orphaned.jpg', out.getvalue())
+
+    def test_collect_batches_queries(self):
+        """Test references are checked with one query per batch"""
+        for i in range(10):
+            self._create_file(f'extra-{i}.jpg', self.old)
+
+        with self.assertNumQueries(4):
+            call_command(
+                'collect_media_garbage', '--batch-size=10',
+                '--max-rate=0', stdout=StringIO()
+            )
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ['recent.jpg', 'referenced.jpg']
+        )
+
+
+class PartitionRecipeTablesTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepassword'
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=5,
+                price=5.0
+            )
+            recipe.tags.add(self.tag)
+
+    @skipIf(connection.vendor == 'postgresql', 'Runs on other databases')
+    def test_partitioning_requires_postgresql(self):
+        """Test partitioning is refused on other databases"""
+        with self.assertRaises(CommandError):
+            call_command('partition_recipe_tables', stdout=StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires PostgreSQL')
+    def test_partition_recipe_tables(self):
+        """Test recipes are copied into partitions that queries prune to"""
+        call_command(
+            'partition_recipe_tables', '--partitions=4', '--batch-size=2',
+            '--sleep=0', stdout=StringIO()
+        )
+
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 5)
+        self.assertEqual(self.tag.recipe_set.count(), 5)
+
+        recipe = Recipe.objects.create(
+            user=self.user, title='New', time_minutes=5, price=5.0
+        )
+        recipe.tags.add(self.tag)
+        recipe.delete()
+
+        plan = recipes.explain()
+        self.assertEqual(plan.count(' on core_recipe_p'), 1)
+
+        # Django's index names moved to the partitioned table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname, indexdef FROM pg_indexes '
+                "WHERE tablename = 'core_recipe'"
+            )
+            indexes = dict(cursor.fetchall())
+        for index in Recipe._meta.indexes:
+            self.assertIn(index.name, indexes)
+        self.assertIn('(id)', indexes['core_recipe_id_idx'])
+
+        # The through tables lost their foreign key to the recipes
+        recipe = recipes.first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Recipe.tags.through.objects.create(recipe_id=0, tag=self.tag)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_recipe WHERE id = %s',
+                           [recipe.id])
+        self.assertEqual(self.tag.recipe_set.count(), 4)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires PostgreSQL')
+    def test_partitioning_requires_postgresql_11(self):
+        """Test partitioning is refused before PostgreSQL 11"""
+        with patch.object(connection, 'pg_version', 100012), \
+                self.assertRaises(CommandError):
+            call_command('partition_recipe_tables', stdout=StringIO())
@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from rest_framework.authtoken.models import Token
+
+from core import deletion
+from core.models import Recipe, Tag, Ingredient, PendingDeletion, \
+                        StoredImage
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def sample_user(email='rsratna24@gmail.com'):
+    """Create and return a sample user"""
+    return get_user_model().objects.create_user(email, 'simplepassword')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe with a tag and an ingredient"""
+    default = {
+        'title': 'Sample title',
+        'time_minutes': 5,
+        'price': 5.0
+    }
+    default.update(params)
+    recipe = Recipe.objects.create(user=user, **default)
+    recipe.tags.add(Tag.objects.create(user=user, name=f'Tag {recipe.id}'))
+    recipe.ingredients.add(
+        Ingredient.objects.create(user=user, name=f'Ingredient {recipe.id}')
+    )
+    return recipe
+
+
+@override_settings(DEFERRED_DELETION=True)
+class DeferredDeletionTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = sample_user()
+        self.other_user = sample_user('ratnakar@gmail.com')
+        self.recipes = [sample_recipe(self.user) for _ in range(5)]
+        self.other_recipe = sample_recipe(self.other_user)
+
+    def test_schedule_recipe_deletion_hides_recipes(self):
+        """Test scheduled recipes are hidden but not yet deleted"""
+        ids = [recipe.id for recipe in self.recipes[:3]]
+        deletion.schedule_recipe_deletion(self.user, ids)
+
+        self.assertEqual(
+            Recipe.objects.filter(pending_deletion=True).count(), 3
+        )
+        self.assertTrue(PendingDeletion.objects.filter(user=self.user))
+
+    def test_delete_pending_recipes_in_batches(self):
+        """Test pending recipes and their links are deleted in batches"""
+        ids = [recipe.id for recipe in self.recipes[:3]]
+        deletion.schedule_recipe_deletion(self.user, ids)
+        progress = []
+
+        deletion.delete_pending(
+            batch_size=2,
+            progress=lambda p: progress.append(p.deleted_count)
+        )
+
+        self.assertEqual(progress, [2, 3])
+        self.assertFalse(Recipe.objects.filter(id__in=ids).exists())
+        self.assertFalse(
+            Recipe.tags.through.objects.filter(recipe_id__in=ids).exists()
+        )
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(PendingDeletion.objects.exists())
+
+    @override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMAGE_STORAGE='content')
+    def test_overlapping_runs_release_once(self):
+        """Test recipes deleted by another run do not release images"""
+        shared, kept = self.recipes[:2]
+        for recipe in (shared, kept):
+            recipe.image.save('a.jpg', ContentFile(b'image bytes'))
+        deletion.schedule_recipe_deletion(self.user, [shared.id])
+        original = deletion._delete_in
+        overlapped = []
+
+        def delete_in(*args):
+            if not overlapped:
+                # A requeued run deletes the same batch first
+                overlapped.append(True)
+                deletion._delete_recipe_batch(self.user.id, 10)
+            return original(*args)
+
+        with patch.object(deletion, '_delete_in', delete_in), \
+                self.captureOnCommitCallbacks(execute=True):
+            deleted = deletion._delete_recipe_batch(self.user.id, 10)
+
+        self.assertEqual(deleted, 0)
+        self.assertEqual(
+            StoredImage.objects.get(name=kept.image.name).ref_count, 1
+        )
+        self.assertTrue(os.path.exists(kept.image.path))
+
+    def test_schedule_user_deletion(self):
+        """Test a scheduled user is deactivated and later deleted"""
+        Token.objects.create(user=self.user)
+        deletion.schedule_user_deletion(self.user)
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+        deletion.delete_pending(batch_size=2)
+
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        self.assertFalse(Tag.objects.filter(user=self.user).exists())
+        self.assertFalse(Ingredient.objects.filter(user=self.user).exists())
+        self.assertTrue(Recipe.objects.filter(pk=self.other_recipe.pk))
+
+    def test_delete_pending_resumes_after_failure(self):
+        """Test an interrupted run keeps its progress and resumes"""
+        deletion.schedule_user_deletion(self.user)
+        calls = []
+        original = deletion._delete_recipe_batch
+
+        def fail_second_batch(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('crash')
+            return original(*args)
+
+        with patch.object(
+            deletion, '_delete_recipe_batch', fail_second_batch
+        ):
+            with self.assertRaises(RuntimeError):
+                deletion.delete_pending(batch_size=2)
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(
+            PendingDeletion.objects.get(user=self.user).deleted_count, 2
+        )
+
+        deletion.delete_pending(batch_size=2)
+
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+        self.assertFalse(PendingDeletion.objects.exists())
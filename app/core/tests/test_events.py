@@ -0,0 +1,269 @@
+import asyncio
+import json
+import threading
+import unittest
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, \
+                        override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from app.asgi import application, EVENTS_PATH
+from core import events
+from core.models import Recipe
+
+
+def sample_recipe(user):
+    """Create and return a sample recipe"""
+    return Recipe.objects.create(
+        user=user, title='Sample title', time_minutes=5, price=5.0
+    )
+
+
+class BroadcasterTests(SimpleTestCase):
+    """Test the in process event fan out"""
+
+    def test_publish_from_other_thread(self):
+        """Test events published by any thread reach the subscriber"""
+        broadcaster = events.Broadcaster()
+
+        async def run():
+            queue = broadcaster.subscribe(1, 10)
+            thread = threading.Thread(
+                target=broadcaster.publish, args=(1, {'seq': 1})
+            )
+            thread.start()
+            thread.join()
+            broadcaster.publish(2, {'seq': 2})
+            event = await asyncio.wait_for(queue.get(), 1)
+            broadcaster.unsubscribe(1, queue)
+            return event, queue.qsize()
+
+        self.assertEqual(asyncio.run(run()), ({'seq': 1}, 0))
+        self.assertEqual(broadcaster.count(), 0)
+
+    def test_full_buffer_resets(self):
+        """Test a subscriber that falls behind is sent a reset"""
+        broadcaster = events.Broadcaster()
+
+        async def run():
+            queue = broadcaster.subscribe(1, 2)
+            for seq in range(5):
+                broadcaster.publish(1, {'seq': seq})
+            await asyncio.sleep(0)
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        received = asyncio.run(run())
+        self.assertIn(events.RESET, received)
+        self.assertLessEqual(len(received), 2)
+
+
+async def open_stream(headers, until, query_string=b''):
+    """Run the ASGI app on the events path until until() has returned
+
+    Returns the response status and the streamed body.
+    """
+    disconnect = asyncio.Event()
+    messages = []
+    started = asyncio.Event()
+
+    async def receive():
+        await disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+        if message['type'] == 'http.response.start':
+            started.set()
+
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': EVENTS_PATH,
+        'query_string': query_string,
+        'headers': headers,
+    }
+    app = asyncio.ensure_future(application(scope, receive, send))
+    await asyncio.wait(
+        [app, asyncio.ensure_future(started.wait())],
+        return_when=asyncio.FIRST_COMPLETED
+    )
+    if not app.done():
+        await until()
+        await asyncio.sleep(0.05)
+        disconnect.set()
+    await asyncio.wait_for(app, 5)
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return messages[0]['status'], body.decode()
+
+
+@override_settings(EVENTS_BACKEND='local', EVENTS_HEARTBEAT_SECONDS=0.01)
+class EventStreamTests(TestCase):
+    """Test the Server-Sent Events change stream"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepass'
+        )
+        self.headers = [(
+            b'authorization',
+            f'Token {Token.objects.create(user=self.user).key}'.encode()
+        )]
+
+    def test_token_required(self):
+        """Test the stream is refused without a valid token"""
+        async def nothing():
+            pass
+
+        status, _ = async_to_sync(open_stream)(
+            [(b'authorization', b'Token wrong')], nothing
+        )
+
+        self.assertEqual(status, 401)
+
+    def test_ticket_from_query_or_cookie(self):
+        """Test browsers connect with a ticket instead of the header"""
+        async def nothing():
+            pass
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.headers[0][1].decode())
+        res = client.post(reverse('recipe:change-stream-ticket'))
+        ticket = res.data['ticket']
+        cookie = res.cookies[events.TICKET_COOKIE]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(cookie.value, ticket)
+        self.assertEqual(cookie['path'], EVENTS_PATH)
+        self.assertTrue(cookie['httponly'])
+        status, _ = async_to_sync(open_stream)(
+            [], nothing, f'ticket={ticket}'.encode()
+        )
+        self.assertEqual(status, 200)
+        status, _ = async_to_sync(open_stream)(
+            [(b'cookie', f'{events.TICKET_COOKIE}={ticket}'.encode())],
+            nothing
+        )
+        self.assertEqual(status, 200)
+
+    def test_ticket_rejected(self):
+        """Test forged, expired and inactive user tickets are refused"""
+        async def nothing():
+            pass
+
+        ticket = events.issue_ticket(self.user)
+
+        status, _ = async_to_sync(open_stream)(
+            [], nothing, f'ticket={ticket}x'.encode()
+        )
+        self.assertEqual(status, 401)
+        with override_settings(EVENTS_TICKET_SECONDS=-1):
+            status, _ = async_to_sync(open_stream)(
+                [], nothing, f'ticket={ticket}'.encode()
+            )
+        self.assertEqual(status, 401)
+        self.user.is_active = False
+        self.user.save()
+        status, _ = async_to_sync(open_stream)(
+            [], nothing, f'ticket={ticket}'.encode()
+        )
+        self.assertEqual(status, 401)
+
+    def test_change_streamed(self):
+        """Test committed changes of the user are pushed with heartbeats"""
+        other = get_user_model().objects.create_user(
+            'ratnakar@gmail.com', 'sample123'
+        )
+
+        @sync_to_async
+        def change():
+            with self.captureOnCommitCallbacks(execute=True):
+                sample_recipe(other)
+                recipe = sample_recipe(self.user)
+            return recipe
+
+        recipes = []
+
+        async def until():
+            recipes.append(await change())
+
+        status, body = async_to_sync(open_stream)(self.headers, until)
+
+        self.assertEqual(status, 200)
+        self.assertIn(': ping\n\n', body)
+        data = [
+            json.loads(line[len('data: '):])
+            for line in body.splitlines() if line.startswith('data: ')
+        ]
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['type'], 'recipe')
+        self.assertEqual(data[0]['ids'], [recipes[0].id])
+        self.assertEqual(events.broadcaster.count(), 0)
+
+
+@unittest.skipUnless(
+    connection.vendor == 'postgresql', 'LISTEN/NOTIFY needs PostgreSQL'
+)
+@override_settings(EVENTS_BACKEND='postgres')
+class NotifyBridgeTests(TransactionTestCase):
+    """Test events cross processes through PostgreSQL"""
+
+    def tearDown(self):
+        events.stop_listener()
+
+    def test_notify_reaches_listener(self):
+        """Test a committed change is delivered by the NOTIFY listener"""
+        user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepass'
+        )
+        events.ensure_listener()
+
+        async def run():
+            queue = events.broadcaster.subscribe(user.pk, 10)
+            try:
+                await asyncio.sleep(0.2)
+                recipe = await sync_to_async(sample_recipe)(user)
+                event = await asyncio.wait_for(queue.get(), 5)
+            finally:
+                events.broadcaster.unsubscribe(user.pk, queue)
+            return recipe, event
+
+        recipe, event = async_to_sync(run)()
+
+        self.assertEqual(event['ids'], [recipe.id])
+        self.assertEqual(event['user'], user.pk)
+
+    def test_malformed_notify_skipped(self):
+        """Test the listener survives payloads it cannot parse"""
+        user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepass'
+        )
+        events.ensure_listener()
+
+        def notify_malformed():
+            with connection.cursor() as cursor:
+                for payload in ('not json', '[]', '{}'):
+                    cursor.execute(
+                        'SELECT pg_notify(%s, %s)', [events.CHANNEL, payload]
+                    )
+
+        async def run():
+            queue = events.broadcaster.subscribe(user.pk, 10)
+            try:
+                await asyncio.sleep(0.2)
+                await sync_to_async(notify_malformed)()
+                recipe = await sync_to_async(sample_recipe)(user)
+                event = await asyncio.wait_for(queue.get(), 5)
+            finally:
+                events.broadcaster.unsubscribe(user.pk, queue)
+            return recipe, event
+
+        with self.assertLogs('core.events', 'ERROR'):
+            recipe, event = async_to_sync(run)()
+
+        self.assertEqual(event['ids'], [recipe.id])
@@ -0,0 +1,133 @@
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.deletion import schedule_user_deletion
+from core.models import Job
+
+calls = []
+
+
+def record_call(*args):
+    """Job recording its arguments"""
+    calls.append(args)
+
+
+def wait(seconds):
+    """Job taking seconds to run"""
+    time.sleep(seconds)
+
+
+def fail():
+    """Job that always fails"""
+    raise ValueError('failed')
+
+
+@override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_BACKOFF=10)
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        """Test queued jobs run with their arguments"""
+        jobs.enqueue(record_call, 1, 'a')
+
+        ran = jobs.run_pending_jobs()
+
+        self.assertEqual(calls, [(1, 'a')])
+        self.assertEqual(ran[0].status, Job.DONE)
+        self.assertIsNotNone(ran[0].duration)
+
+    def test_delayed_job_not_due(self):
+        """Test delayed jobs wait until they are due"""
+        jobs.enqueue(record_call, delay=60)
+
+        self.assertEqual(jobs.run_pending_jobs(), [])
+
+    def test_enqueue_unique(self):
+        """Test unique jobs are queued once"""
+        jobs.enqueue(record_call, 1, unique=True)
+        jobs.enqueue(record_call, 1, unique=True)
+
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_failed_job_retried_with_backoff(self):
+        """Test a failing job is retried later and then marked failed"""
+        job = jobs.enqueue(fail)
+
+        jobs.run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('ValueError', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_jobs_requeued(self):
+        """Test running jobs without a recent heartbeat are queued again"""
+        job = jobs.enqueue(record_call)
+        jobs.claim_job()
+        Job.objects.filter(pk=job.pk).update(
+            started_at=timezone.now() - timedelta(hours=2),
+            heartbeat_at=timezone.now() - timedelta(seconds=30)
+        )
+        self.assertEqual(jobs.requeue_stale_jobs(60), 0)
+
+        Job.objects.filter(pk=job.pk).update(
+            heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(jobs.requeue_stale_jobs(60), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+
+    def test_run_worker_once(self):
+        """Test the worker command runs due jobs and reports timings"""
+        jobs.enqueue(record_call, 2)
+        out = StringIO()
+
+        call_command('run_worker', '--once', stdout=out)
+
+        self.assertEqual(calls, [(2,)])
+        self.assertIn('record_call: 1 runs', out.getvalue())
+
+    @override_settings(DEFERRED_DELETION=True)
+    def test_deferred_deletion_runs_as_job(self):
+        """Test scheduling a deletion queues the batched delete"""
+        user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepassword'
+        )
+        schedule_user_deletion(user)
+
+        jobs.run_pending_jobs()
+
+        self.assertFalse(get_user_model().objects.filter(pk=user.pk))
+
+
+@override_settings(JOB_HEARTBEAT_SECONDS=0.01)
+class JobHeartbeatTests(TransactionTestCase):
+
+    def test_heartbeat_while_running(self):
+        """Test a long job keeps its heartbeat fresh while it runs"""
+        jobs.enqueue(wait, 0.2)
+        job = jobs.claim_job()
+        Job.objects.filter(pk=job.pk).update(
+            heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+
+        jobs.run_job(job)
+
+        job.refresh_from_db()
+        self.assertGreater(job.heartbeat_at, job.started_at)
+        self.assertEqual(job.status, Job.DONE)
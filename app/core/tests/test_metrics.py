@@ -0,0 +1,132 @@
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, SimpleTestCase, TestCase, \
+                        override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.views import metrics as metrics_view
+
+
+class MetricsStoreTests(SimpleTestCase):
+    """Test the per process metric files"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_values_survive_reopen(self):
+        """Test values are read back after the file grows"""
+        path = os.path.join(self.directory.name, '1.db')
+        values = metrics.MmapedValues(path)
+        items = [(f'key-{i}' * 10, i) for i in range(2000)]
+        values.add(items)
+        values.add([('key-1' * 10, 0.5)])
+
+        reopened = dict(metrics.read_values(
+            metrics.MmapedValues(path)._map
+        ))
+
+        self.assertEqual(len(reopened), 2000)
+        self.assertEqual(reopened['key-1' * 10], 1.5)
+
+    def test_collect_sums_processes(self):
+        """Test the exposition sums the files of every process"""
+        key = metrics.CACHE_REQUESTS._key(('similarity', 'hit'))
+        for pid in (1, 2):
+            metrics.MmapedValues(
+                os.path.join(self.directory.name, f'{pid}.db')
+            ).add([(key, 2)])
+
+        with override_settings(METRICS_DIR=self.directory.name):
+            text = metrics.collect()
+
+        self.assertIn(
+            'app_cache_requests_total{cache="similarity",result="hit"} 4',
+            text
+        )
+        self.assertIn('app_cache_hit_ratio{cache="similarity"} 1', text)
+
+
+class MetricsEndpointTests(TestCase):
+    """Test the metrics endpoint"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings = override_settings(METRICS_DIR=self.directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_requests_recorded(self):
+        """Test served requests show up as cumulative buckets"""
+        self.client.get(reverse('recipe:recipe-list'))
+        self.client.get(reverse('recipe:recipe-list'))
+
+        res = self.client.get(reverse('metrics'))
+        text = res.content.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        self.assertIn(
+            'http_request_duration_seconds_bucket{route="recipe:recipe-list",'
+            'method="GET",le="+Inf"} 2',
+            text
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{route="recipe:recipe-list",'
+            'method="GET"} 2',
+            text
+        )
+        self.assertIn(
+            'http_request_sql_queries_total{route="recipe:recipe-list"}',
+            text
+        )
+
+    def test_unknown_method_recorded_as_other(self):
+        """Test client supplied methods do not add label values"""
+        self.client.generic('BREW', reverse('recipe:recipe-list'))
+
+        text = metrics.collect()
+
+        self.assertIn(
+            'http_request_duration_seconds_count{route="recipe:recipe-list",'
+            'method="other"} 1',
+            text
+        )
+        self.assertNotIn('BREW', text)
+
+    def test_missing_directory(self):
+        """Test metrics are served before any process wrote a sample"""
+        with override_settings(
+            METRICS_DIR=os.path.join(self.directory.name, 'missing')
+        ):
+            res = metrics_view(RequestFactory().get('/metrics'))
+
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_scrape_restricted(self):
+        """Test remote clients need the metrics token"""
+        remote = {'REMOTE_ADDR': '203.0.113.5'}
+
+        denied = self.client.get(reverse('metrics'), **remote)
+        wrong = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong', **remote
+        )
+        allowed = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret', **remote
+        )
+
+        self.assertEqual(denied.status_code, 403)
+        self.assertEqual(wrong.status_code, 403)
+        self.assertEqual(allowed.status_code, 200)
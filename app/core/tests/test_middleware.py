@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+ME_URL = reverse('user:me')
+ADMIN_LOGIN_URL = reverse('admin:login')
+
+
+class SessionStackMiddlewareTests(TestCase):
+    """Test token API paths skip the session middleware"""
+
+    def test_api_skips_sessions(self):
+        """Test token authenticated API requests get no session"""
+        user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepass'
+        )
+        token = Token.objects.create(user=user)
+
+        res = self.client.get(
+            ME_URL, HTTP_AUTHORIZATION=f'Token {token.key}'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], user.email)
+        self.assertFalse(hasattr(res.wsgi_request, 'session'))
+
+    def test_admin_keeps_sessions(self):
+        """Test the admin still runs sessions and CSRF checks"""
+        res = self.client.get(ADMIN_LOGIN_URL)
+        self.assertTrue(hasattr(res.wsgi_request, 'session'))
+        self.assertTrue(res.wsgi_request.user.is_anonymous)
+
+        res = Client(enforce_csrf_checks=True).post(
+            ADMIN_LOGIN_URL, {'username': 'a', 'password': 'b'}
+        )
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
@@ -66,3 +66,31 @@ class ModelTests(TestCase):
             price=5.0
         )
         self.assertEqual(str(recipe), recipe.title)
+
+    def test_recipe_ingredient_count(self):
+        """Test the ingredient count follows changes from both sides"""
+        user = sample_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Steak and mushroom sauce',
+            time_minutes=5,
+            price=5.0
+        )
+        steak = models.Ingredient.objects.create(user=user, name='Steak')
+        mushroom = models.Ingredient.objects.create(user=user, name='Mushroom')
+
+        recipe.ingredients.add(steak, mushroom)
+        self.assertEqual(recipe.ingredient_count, 2)
+
+        steak.recipe_set.remove(recipe)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredient_count, 1)
+
+        mushroom.recipe_set.clear()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredient_count, 0)
+
+        recipe.ingredients.set([steak])
+        steak.delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredient_count, 0)
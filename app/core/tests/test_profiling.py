@@ -0,0 +1,103 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class ProfilingTests(TestCase):
+    """Test on demand profiling of API requests"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        override = override_settings(PROFILE_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.staff = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepass', is_staff=True
+        )
+        self.user = get_user_model().objects.create_user(
+            'ratnakar@gmail.com', 'sample123'
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def client_for(self, user):
+        client = APIClient()
+        token = self.token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def test_staff_request_profiled(self):
+        """Test a staff request with the flag stores profile and SQL"""
+        client = self.client_for(self.staff)
+
+        res = client.get(RECIPE_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        profile_id = res['X-Profile-Id']
+        with open(os.path.join(self.directory, f'{profile_id}.json')) as f:
+            text = f.read()
+        report = json.loads(text)
+        self.assertEqual(report['user'], self.staff.pk)
+        self.assertNotIn(self.token.key, text)
+        self.assertNotIn('params', report['queries'][0])
+        self.assertTrue(
+            any('core_recipe' in q['sql'] for q in report['queries'])
+        )
+        pstats.Stats(os.path.join(self.directory, f'{profile_id}.prof'))
+
+        url = reverse('profile-download', args=[profile_id, 'json'])
+        res = client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(b''.join(res))['id'], profile_id)
+
+    def test_unflagged_request_not_profiled(self):
+        """Test staff requests without the flag are not profiled"""
+        res = self.client_for(self.staff).get(RECIPE_URL)
+
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_disabled_flag_not_profiled(self):
+        """Test a flag turned off does not profile"""
+        client = self.client_for(self.staff)
+
+        res = client.get(RECIPE_URL, {'profile': 0})
+        res_header = client.get(RECIPE_URL, HTTP_X_PROFILE='false')
+
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertNotIn('X-Profile-Id', res_header)
+
+    def test_non_staff_not_profiled(self):
+        """Test the flag is ignored and downloads refused for other users"""
+        client = self.client_for(self.user)
+
+        res = client.get(RECIPE_URL, {'profile': 1})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', res)
+
+        url = reverse('profile-download', args=['0' * 32, 'prof'])
+        res = client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(PROFILE_MAX_COUNT=2)
+    def test_old_profiles_removed(self):
+        """Test only the newest profiles are kept"""
+        client = self.client_for(self.staff)
+
+        for _ in range(3):
+            client.get(RECIPE_URL, HTTP_X_PROFILE='1')
+
+        self.assertEqual(len(os.listdir(self.directory)), 4)
@@ -0,0 +1,144 @@
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.db.utils import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import routers
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import Recipe
+from recipe.views import RecipeViewSet
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def sample_recipe(user, using='default', **params):
+    """Create and return a sample recipe in the given database"""
+    default = {
+        'title': 'Sample title',
+        'time_minutes': 5,
+        'price': 5.0
+    }
+    default.update(params)
+    return Recipe.objects.using(using).create(user=user, **default)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTests(TestCase):
+    """Test read replica routing with the replica as a second database"""
+    databases = {'default', 'replica_0'}
+
+    def setUp(self):
+        cache.clear()
+        routers._unhealthy_until.clear()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'simplepassword'
+        )
+        # Replicate the user so replica rows can reference it
+        self.user.save(using='replica_0')
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        sample_recipe(self.user, title='On primary')
+        sample_recipe(self.user, using='replica_0', title='On replica')
+
+    def _titles(self, res):
+        return [recipe['title'] for recipe in res.data]
+
+    def test_safe_requests_read_from_replica(self):
+        """Test listing recipes is served by the replica"""
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._titles(res), ['On replica'])
+
+    def test_reads_after_write_use_primary(self):
+        """Test a client reads from the primary after writing"""
+        payload = {'title': 'New recipe', 'time_minutes': 5, 'price': 5.0}
+        res = self.client.post(RECIPE_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(self._titles(res), ['New recipe', 'On primary'])
+        self.assertFalse(
+            Recipe.objects.using('replica_0').filter(
+                title='New recipe'
+            ).exists()
+        )
+
+    def test_pin_expires(self):
+        """Test reads return to the replica once the pin expires"""
+        payload = {'title': 'New recipe', 'time_minutes': 5, 'price': 5.0}
+        with override_settings(REPLICA_PIN_SECONDS=0):
+            self.client.post(RECIPE_URL, payload)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(self._titles(res), ['On replica'])
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        """Test reads use the primary when the replica is down"""
+        with patch.object(
+            connections['replica_0'], 'ensure_connection',
+            side_effect=OperationalError
+        ):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(self._titles(res), ['On primary'])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        """Test all reads use the primary without replicas"""
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(self._titles(res), ['On primary'])
+
+    def _session_reads_replica(self, method, session, new_session=None):
+        """Run a session request through the middleware
+
+        Returns whether a recipe list view would have read from the replica.
+        """
+        reads_replica = []
+
+        def get_response(request):
+            middleware.process_view(
+                request, RecipeViewSet.as_view({'get': 'list'}), (), {}
+            )
+            reads_replica.append(routers._read_from_replica.get())
+            response = HttpResponse()
+            if new_session:
+                response.set_cookie(settings.SESSION_COOKIE_NAME, new_session)
+            return response
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        request = getattr(RequestFactory(), method)(RECIPE_URL)
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = session
+        middleware(request)
+        return reads_replica[0]
+
+    def test_session_reads_after_write_use_primary(self):
+        """Test session clients without a token are pinned by session"""
+        self.assertTrue(self._session_reads_replica('get', 'first'))
+
+        self._session_reads_replica('post', 'first')
+
+        self.assertFalse(self._session_reads_replica('get', 'first'))
+        self.assertTrue(self._session_reads_replica('get', 'other'))
+
+    def test_new_session_pinned(self):
+        """Test the session started by a write is the one pinned"""
+        self._session_reads_replica('post', 'anonymous', 'logged-in')
+
+        self.assertFalse(self._session_reads_replica('get', 'logged-in'))
+        self.assertTrue(self._session_reads_replica('get', 'anonymous'))
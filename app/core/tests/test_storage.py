@@ -0,0 +1,122 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from core.models import Recipe, StoredImage
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    default = {
+        'title': 'Sample title',
+        'time_minutes': 5,
+        'price': 5.0
+    }
+    default.update(params)
+    return Recipe.objects.create(user=user, **default)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMAGE_STORAGE='content')
+class ContentAddressedStorageTests(TestCase):
+    """Test content addressed recipe image storage"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'simplepassword'
+        )
+        self.content = b'fake image bytes'
+        self.digest = hashlib.sha256(self.content).hexdigest()
+
+    def test_image_stored_by_digest(self):
+        """Test the image is named after its content digest"""
+        recipe = sample_recipe(self.user)
+        recipe.image.save('photo.JPG', ContentFile(self.content))
+
+        self.assertEqual(
+            recipe.image.name, f'uploads/recipe/{self.digest}.jpg'
+        )
+        self.assertTrue(os.path.exists(recipe.image.path))
+        self.assertEqual(
+            StoredImage.objects.get(name=recipe.image.name).ref_count, 1
+        )
+
+    def test_identical_uploads_share_file(self):
+        """Test identical uploads are stored once and reference counted"""
+        recipe1 = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+        recipe1.image.save('a.jpg', ContentFile(self.content))
+        recipe2.image.save('b.jpg', ContentFile(self.content))
+
+        self.assertEqual(recipe1.image.name, recipe2.image.name)
+        self.assertEqual(
+            os.listdir(os.path.dirname(recipe1.image.path)),
+            [f'{self.digest}.jpg']
+        )
+        self.assertEqual(
+            StoredImage.objects.get(name=recipe1.image.name).ref_count, 2
+        )
+
+    def test_reused_file_touched(self):
+        """Test reusing a file restarts its garbage collection grace period"""
+        recipe1 = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+        recipe1.image.save('a.jpg', ContentFile(self.content))
+        old = time.time() - 2 * 24 * 60 * 60
+        os.utime(recipe1.image.path, (old, old))
+
+        recipe2.image.save('b.jpg', ContentFile(self.content))
+
+        self.assertGreater(os.stat(recipe2.image.path).st_mtime, old + 60)
+
+    def test_file_removed_with_last_reference(self):
+        """Test the file is deleted once no recipe references it"""
+        recipe1 = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+        recipe1.image.save('a.jpg', ContentFile(self.content))
+        recipe2.image.save('b.jpg', ContentFile(self.content))
+        path = recipe1.image.path
+
+        recipe1.delete()
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe2.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_replaced_image_released(self):
+        """Test replacing an image releases the previous one"""
+        recipe = sample_recipe(self.user)
+        recipe.image.save('a.jpg', ContentFile(self.content))
+        old_path = recipe.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.image.save('b.jpg', ContentFile(b'other image bytes'))
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(recipe.image.path))
+
+    def test_resaving_same_image_keeps_file(self):
+        """Test re-uploading the same image keeps a single reference"""
+        recipe = sample_recipe(self.user)
+        recipe.image.save('a.jpg', ContentFile(self.content))
+        recipe.image.save('a.jpg', ContentFile(self.content))
+
+        self.assertTrue(os.path.exists(recipe.image.path))
+        self.assertEqual(
+            StoredImage.objects.get(name=recipe.image.name).ref_count, 1
+        )
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import SharedTokenBuckets, get_buckets, parse_rate
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class SharedTokenBucketsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'buckets')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse_rate(self):
+        """Test rates are parsed into requests and seconds"""
+        self.assertEqual(parse_rate('100/min'), (100, 60))
+        self.assertEqual(parse_rate('5/hour'), (5, 3600))
+
+    def test_bucket_empties_and_refills(self):
+        """Test requests are denied once the bucket is empty"""
+        buckets = SharedTokenBuckets(self.path, 1024)
+        self.addCleanup(buckets.close)
+
+        results = [buckets.consume('key', 2, 1.0, now=100)[0]
+                   for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+
+        allowed, tokens = buckets.consume('key', 2, 1.0, now=101)
+        self.assertTrue(allowed)
+        self.assertAlmostEqual(tokens, 0)
+
+    def test_buckets_shared_between_instances(self):
+        """Test separately opened maps share the same buckets"""
+        first = SharedTokenBuckets(self.path, 1024)
+        second = SharedTokenBuckets(self.path, 1024)
+        self.addCleanup(first.close)
+        self.addCleanup(second.close)
+
+        self.assertTrue(first.consume('key', 1, 0.1, now=100)[0])
+        self.assertFalse(second.consume('key', 1, 0.1, now=100)[0])
+        self.assertTrue(second.consume('other', 1, 0.1, now=100)[0])
+
+    def test_buckets_reopened_on_override(self):
+        """Test overriding the file closes the buckets opened for it"""
+        with override_settings(RATE_LIMIT_FILE=self.path):
+            buckets = get_buckets()
+            self.assertEqual(buckets.path, self.path)
+
+        self.assertTrue(buckets._map.closed)
+
+
+class RateLimitAPITests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(
+            RATE_LIMIT_FILE=os.path.join(self.directory, 'buckets'),
+            RATE_LIMITS={'read': '2/min', 'write': '1/min'}
+        )
+        self.settings.enable()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'simplepassword'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+
+    def test_buckets_in_test_file(self):
+        """Test requests consume from the file of this test only"""
+        self.client.get(RECIPE_URL)
+
+        self.assertEqual(
+            get_buckets().path, os.path.join(self.directory, 'buckets')
+        )
+
+    def test_rate_limit_headers(self):
+        """Test responses carry the rate limit state"""
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['RateLimit-Limit'], '2')
+        self.assertEqual(res['RateLimit-Remaining'], '1')
+        self.assertEqual(res['RateLimit-Reset'], '30')
+
+    def test_rate_limit_exceeded(self):
+        """Test requests over the budget are rejected"""
+        self.client.get(RECIPE_URL)
+        self.client.get(RECIPE_URL)
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['RateLimit-Remaining'], '0')
+        self.assertIn('Retry-After', res)
+
+    def test_read_and_write_budgets_separate(self):
+        """Test writes do not use up the read budget"""
+        payload = {'title': 'Curry', 'time_minutes': 5, 'price': 5.0}
+        self.client.post(RECIPE_URL, payload)
+        res = self.client.post(RECIPE_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def media_url(path):
+    """Return the url serving a media file"""
+    return reverse('media', args=[path])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_SENDFILE_BACKEND=None)
+class ServeMediaTests(TestCase):
+    """Test serving uploaded media files"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.path = 'uploads/recipe/test-uuid.jpg'
+        full_path = os.path.join(MEDIA_ROOT, self.path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(b'0123456789')
+
+    def test_serve_full_file(self):
+        """Test full file is returned with long lived cache headers"""
+        res = self.client.get(media_url(self.path))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), b'0123456789')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('ETag', res)
+        self.assertIn('Last-Modified', res)
+
+    def test_serve_range(self):
+        """Test a byte range is returned as partial content"""
+        res = self.client.get(media_url(self.path), HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), b'2345')
+        self.assertEqual(res['Content-Range'], 'bytes 2-5/10')
+
+    def test_serve_suffix_range(self):
+        """Test a suffix byte range returns the end of the file"""
+        res = self.client.get(media_url(self.path), HTTP_RANGE='bytes=-3')
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), b'789')
+
+    def test_unsatisfiable_range(self):
+        """Test a range past the end of the file is rejected"""
+        res = self.client.get(media_url(self.path), HTTP_RANGE='bytes=20-')
+
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], 'bytes */10')
+
+    def test_not_modified(self):
+        """Test matching ETag returns not modified"""
+        etag = self.client.get(media_url(self.path))['ETag']
+        res = self.client.get(media_url(self.path), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+
+    def test_missing_file(self):
+        """Test missing files and path traversal return not found"""
+        res = self.client.get(media_url('uploads/recipe/missing.jpg'))
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client.get(media_url('../settings.py'))
+        self.assertEqual(res.status_code, 404)
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='nginx')
+    def test_serve_with_x_accel_redirect(self):
+        """Test nginx backend delegates the transfer"""
+        res = self.client.get(media_url(self.path))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res['X-Accel-Redirect'], f'/protected-media/{self.path}'
+        )
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='apache')
+    def test_serve_with_x_sendfile(self):
+        """Test apache backend delegates the transfer"""
+        res = self.client.get(media_url(self.path))
+
+        self.assertEqual(
+            res['X-Sendfile'], os.path.join(MEDIA_ROOT, self.path)
+        )
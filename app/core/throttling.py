@@ -0,0 +1,147 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from rest_framework.throttling import BaseThrottle
+
+# Fingerprint of the bucket key, tokens left and time of the last update
+SLOT = struct.Struct('=Qdd')
+THREAD_LOCK_STRIPES = 64
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """Return (requests, seconds) for a rate such as '100/min'"""
+    requests, period = rate.split('/')
+    return int(requests), PERIODS[period[0]]
+
+
+class SharedTokenBuckets:
+    """Token buckets kept in a memory mapped file shared by all workers
+
+    Each key hashes to one fixed size slot of the file. A slot is guarded
+    by a byte range lock between processes and by a striped lock between
+    threads, so updates cost a hash and two uncontended locks. Keys that
+    collide on a slot simply restart with a full bucket.
+    """
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        size = slots * SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._locks = [
+            threading.Lock() for _ in range(THREAD_LOCK_STRIPES)
+        ]
+
+    def consume(self, key, capacity, rate, now=None):
+        """Take a token from key's bucket
+
+        Returns whether the request is allowed and the tokens left.
+        """
+        now = time.time() if now is None else now
+        fingerprint = int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little'
+        )
+        index = fingerprint % self.slots
+        offset = index * SLOT.size
+
+        with self._locks[index % THREAD_LOCK_STRIPES]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                stored, tokens, updated = SLOT.unpack_from(self._map, offset)
+                if stored != fingerprint:
+                    tokens, updated = capacity, now
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                SLOT.pack_into(self._map, offset, fingerprint, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT.size, offset)
+        return allowed, tokens
+
+    def close(self):
+        """Unmap the buckets and close the file"""
+        self._map.close()
+        os.close(self._fd)
+
+
+_buckets = None
+
+
+def get_buckets():
+    """Return the shared token buckets of this process"""
+    global _buckets
+    if _buckets is None:
+        _buckets = SharedTokenBuckets(
+            settings.RATE_LIMIT_FILE, settings.RATE_LIMIT_SLOTS
+        )
+    return _buckets
+
+
+@receiver(setting_changed)
+def rate_limit_file_changed(setting, **kwargs):
+    """Reopen the buckets when a test overrides their file"""
+    global _buckets
+    if setting in ('RATE_LIMIT_FILE', 'RATE_LIMIT_SLOTS') and \
+            _buckets is not None:
+        _buckets.close()
+        _buckets = None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Rate limit users, or anonymous clients by address, per scope
+
+    Reads, writes and image uploads have separate budgets configured in
+    RATE_LIMITS. The state of the last check is left on the request for
+    RateLimitHeadersMiddleware.
+    """
+
+    def get_scope(self, request, view):
+        if getattr(view, 'action', None) == 'upload_image':
+            return 'upload'
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return 'read'
+        return 'write'
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        scope = self.get_scope(request, view)
+        rate = settings.RATE_LIMITS.get(scope)
+        if rate is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        refill = capacity / period
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'anon:{self.get_ident(request)}'
+        allowed, tokens = get_buckets().consume(
+            f'{scope}:{ident}', capacity, refill
+        )
+
+        if not allowed:
+            self.wait_seconds = (1 - tokens) / refill
+        request._request.rate_limit = (
+            capacity,
+            int(tokens),
+            math.ceil((capacity - tokens) / refill)
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
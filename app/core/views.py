@@ -0,0 +1,189 @@
+import mimetypes
+import os
+import posixpath
+import re
+from hmac import compare_digest
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, \
+                        HttpResponseForbidden, \
+                        StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+from core.authentication import CachedTokenAuthentication
+from core.metrics import collect
+from core.profiling import profile_path
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def _media_etag(stat):
+    """Return a strong ETag for a media file"""
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def _parse_range(header, size):
+    """Return the (start, end) byte range requested, end inclusive
+
+    Returns None when the header should be ignored and False when the
+    range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start > end or start >= size:
+        return False
+    return start, min(end, size - 1)
+
+
+def _read_range(file_obj, start, length):
+    """Yield the requested slice of an open file in chunks"""
+    with file_obj:
+        file_obj.seek(start)
+        while length > 0:
+            chunk = file_obj.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(path, full_path):
+    """Hand the transfer of a media file to the front-end server"""
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE_BACKEND == 'nginx':
+        response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_URL + path
+    else:
+        response['X-Sendfile'] = full_path
+    # Let the front-end server work out the content type itself
+    del response['Content-Type']
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve an uploaded media file with caching and Range support"""
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    etag = _media_etag(stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+
+    if response is None and settings.MEDIA_SENDFILE_BACKEND:
+        response = _sendfile_response(path, full_path)
+
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if 'HTTP_RANGE' in request.META and (
+                not if_range or if_range == etag):
+            byte_range = _parse_range(request.META['HTTP_RANGE'], stat.st_size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _read_range(open(full_path, 'rb'), start, end - start + 1),
+                status=206,
+                content_type=content_type
+            )
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            # FileResponse lets the WSGI server use wsgi.file_wrapper,
+            # which is sendfile() under gunicorn and uWSGI
+            response = FileResponse(
+                open(full_path, 'rb'), content_type=content_type
+            )
+            response['Content-Length'] = stat.st_size
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['Accept-Ranges'] = 'bytes'
+    if response.status_code >= 400:
+        return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = (
+        f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+    )
+    return response
+
+
+class ProfileDownloadView(APIView):
+    """Download a stored request profile, staff only
+
+    The .prof file loads with pstats or snakeviz, the .json file holds
+    the captured SQL.
+    """
+    authentication_classes = (CachedTokenAuthentication, SessionAuthentication)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, profile_id, kind):
+        try:
+            return FileResponse(
+                open(profile_path(profile_id, kind), 'rb'),
+                as_attachment=True
+            )
+        except FileNotFoundError:
+            raise Http404
+
+
+def _may_scrape(request):
+    """Return whether the client may read the metrics"""
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    scheme, _, token = request.META.get(
+        'HTTP_AUTHORIZATION', ''
+    ).partition(' ')
+    return bool(settings.METRICS_TOKEN) and scheme.lower() == 'bearer' and \
+        compare_digest(token.encode(), settings.METRICS_TOKEN.encode())
+
+
+@require_safe
+def metrics(request):
+    """Expose the metrics of all workers in Prometheus text format
+
+    Only clients in METRICS_ALLOWED_IPS or sending METRICS_TOKEN as a
+    bearer token may read them.
+    """
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        collect(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
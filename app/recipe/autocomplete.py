@@ -0,0 +1,83 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.metrics import record_cache
+
+
+def _version_key(model, user_id):
+    return f'recipe:autocomplete:version:{model._meta.label_lower}:{user_id}'
+
+
+class NameIndex:
+    """Names of one user's tags or ingredients sorted for prefix lookups"""
+
+    def __init__(self, rows, version):
+        self.version = version
+        entries = sorted((name.casefold(), name, pk) for pk, name in rows)
+        self.keys = [key for key, _, _ in entries]
+        self.entries = [{'id': pk, 'name': name} for _, name, pk in entries]
+
+    def prefix(self, prefix, limit):
+        """Return the first names starting with prefix"""
+        prefix = prefix.casefold()
+        start = bisect_left(self.keys, prefix)
+        end = min(start + limit, len(self.keys))
+        while end > start and not self.keys[end - 1].startswith(prefix):
+            end -= 1
+        return self.entries[start:end]
+
+    def search(self, text, limit):
+        """Return names starting with text, then names containing it"""
+        matches = self.prefix(text, limit)
+        text = text.casefold()
+        for key, entry in zip(self.keys, self.entries):
+            if len(matches) == limit:
+                break
+            if text in key and not key.startswith(text):
+                matches.append(entry)
+        return matches
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_name_index(model, user_id):
+    """Return the cached names of a user, None if they are too many"""
+    version = cache.get_or_set(_version_key(model, user_id), 1, None)
+    key = (model._meta.label_lower, user_id)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and index.version == version:
+            _indexes.move_to_end(key)
+            record_cache('autocomplete', True)
+            return index
+
+    record_cache('autocomplete', False)
+    rows = list(model.objects.filter(user_id=user_id).values_list(
+        'id', 'name'
+    )[:settings.RECIPE_AUTOCOMPLETE_MAX_NAMES + 1])
+    if len(rows) > settings.RECIPE_AUTOCOMPLETE_MAX_NAMES:
+        return None
+    index = NameIndex(rows, version)
+    with _indexes_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > settings.RECIPE_AUTOCOMPLETE_CACHED_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def invalidate(model, user_id):
+    """Drop the cached names of a user everywhere"""
+    key = _version_key(model, user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+    with _indexes_lock:
+        _indexes.pop((model._meta.label_lower, user_id), None)
@@ -0,0 +1,63 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.metrics import record_cache
+
+
+def _version_key(recipe_id):
+    return f'recipe:fragment:version:{recipe_id}'
+
+
+def _fragment_key(kind, recipe_id, version):
+    return f'recipe:fragment:{kind}:{recipe_id}:{version}'
+
+
+def render(kind, recipe_ids, serialize):
+    """Return the cached representations of recipe_ids in order
+
+    Fragments are keyed by recipe id and a version that invalidate()
+    replaces, so a fragment rendered from data that changed meanwhile is
+    never read. serialize(ids) renders the missing ones; recipes it does
+    not return are left out.
+    """
+    if not recipe_ids:
+        return []
+    version_keys = {i: _version_key(i) for i in recipe_ids}
+    versions = cache.get_many(version_keys.values())
+    new_versions = {
+        key: uuid.uuid4().hex
+        for key in version_keys.values() if key not in versions
+    }
+    if new_versions:
+        cache.set_many(new_versions, settings.RECIPE_FRAGMENT_TIMEOUT)
+        versions.update(new_versions)
+
+    keys = {
+        i: _fragment_key(kind, i, versions[key])
+        for i, key in version_keys.items()
+    }
+    fragments = cache.get_many(keys.values())
+    missing = [i for i in keys if keys[i] not in fragments]
+    record_cache('recipe_fragments', True, len(keys) - len(missing))
+    if missing:
+        record_cache('recipe_fragments', False, len(missing))
+        rendered = {
+            keys[data['id']]: data for data in serialize(missing)
+        }
+        cache.set_many(rendered, settings.RECIPE_FRAGMENT_TIMEOUT)
+        fragments.update(rendered)
+    return [fragments[keys[i]] for i in recipe_ids if keys[i] in fragments]
+
+
+def invalidate(recipe_ids):
+    """Drop the fragments of recipe_ids, again once the change commits"""
+    keys = [_version_key(i) for i in recipe_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # A request may have cached the old data under the new version
+    # before the transaction committed
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,171 @@
+import os
+import tempfile
+import threading
+import zlib
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files import locks
+
+from core.metrics import record_cache
+from core.models import Recipe
+
+LOCK_STRIPES = 64
+TRIM_LOW_WATER = 0.9
+
+
+class ImageVariantCache:
+    """Bounded on-disk cache of resized recipe images
+
+    Variants are stored as files named after the source image, width and
+    quality. A hit touches the file's mtime so eviction can drop the least
+    recently used variants once the cache grows past max_bytes. Misses for
+    the same variant are serialised on a striped file lock so that only one
+    process or thread performs the resize.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._written = 0
+        self._written_lock = threading.Lock()
+
+    def variant_path(self, source_path, width, quality):
+        """Return the cache path of a variant of source_path"""
+        stem, ext = os.path.splitext(os.path.basename(source_path))
+        return os.path.join(
+            self.directory, f'{stem}-w{width}-q{quality}{ext.lower()}'
+        )
+
+    def get(self, source_path, width, quality):
+        """Return the path of the variant, resizing it on a miss"""
+        path = self.variant_path(source_path, width, quality)
+        if self._touch(path):
+            record_cache('image_variants', True)
+            return path
+        record_cache('image_variants', False)
+
+        os.makedirs(os.path.join(self.directory, 'locks'), exist_ok=True)
+        with open(self._lock_path(path), 'a') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                # Another worker may have built it while we waited
+                if self._touch(path):
+                    return path
+                size = self._resize(source_path, path, width, quality)
+            finally:
+                locks.unlock(lock_file)
+
+        self._record_write(size)
+        return path
+
+    def open(self, source_path, width, quality):
+        """Open the variant for reading, resizing it on a miss
+
+        A trim() in another thread or process may evict the variant
+        between the lookup and the open, it is then resized again.
+        """
+        path = self.get(source_path, width, quality)
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            return open(self.get(source_path, width, quality), 'rb')
+
+    def _touch(self, path):
+        """Mark a cached variant as recently used, if it exists"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _lock_path(self, path):
+        stripe = zlib.crc32(path.encode()) % LOCK_STRIPES
+        return os.path.join(self.directory, 'locks', f'{stripe}.lock')
+
+    def _resize(self, source_path, path, width, quality):
+        """Write the resized variant atomically and return its size"""
+        with Image.open(source_path) as image:
+            image_format = image.format
+            if image.width > width:
+                height = max(round(image.height * width / image.width), 1)
+                image = image.resize((width, height), Image.LANCZOS)
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            fd, temp_path = tempfile.mkstemp(dir=self.directory)
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    image.save(
+                        temp_file,
+                        format=image_format,
+                        quality=quality,
+                        optimize=True
+                    )
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        return os.path.getsize(path)
+
+    def _record_write(self, size):
+        """Trim the cache once enough new bytes have been written"""
+        with self._written_lock:
+            self._written += size
+            if self._written < self.max_bytes * (1 - TRIM_LOW_WATER):
+                return
+            self._written = 0
+        self.trim()
+
+    def trim(self):
+        """Evict least recently used variants down to the low water mark"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+
+        target = self.max_bytes * TRIM_LOW_WATER
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_variant_cache = None
+
+
+def get_variant_cache():
+    """Return the process wide recipe image variant cache"""
+    global _variant_cache
+    if _variant_cache is None or \
+            _variant_cache.directory != settings.RECIPE_IMAGE_CACHE_DIR:
+        _variant_cache = ImageVariantCache(
+            settings.RECIPE_IMAGE_CACHE_DIR,
+            settings.RECIPE_IMAGE_CACHE_MAX_BYTES
+        )
+    return _variant_cache
+
+
+def warm_recipe_image(recipe_id):
+    """Build the RECIPE_IMAGE_WARM_WIDTHS variants of a recipe image"""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    cache = get_variant_cache()
+    for width in settings.RECIPE_IMAGE_WARM_WIDTHS:
+        cache.get(
+            recipe.image.path, width, settings.RECIPE_IMAGE_DEFAULT_QUALITY
+        )
@@ -0,0 +1,63 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from PIL import Image
+
+from django.core.management import BaseCommand
+
+from recipe.images import ImageVariantCache
+
+
+def _format(samples):
+    """Return mean, median and p95 of samples in milliseconds"""
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return 'mean {:.3f} ms  p50 {:.3f} ms  p95 {:.3f} ms'.format(
+        statistics.mean(samples) * 1000,
+        statistics.median(samples) * 1000,
+        p95 * 1000
+    )
+
+
+class Command(BaseCommand):
+    """Django command to measure resized image cache hit and miss latency"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--source-width', type=int, default=2400)
+        parser.add_argument('--width', type=int, default=640)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            source = os.path.join(directory, 'source.jpg')
+            width = options['source_width']
+            Image.effect_mandelbrot(
+                (width, width * 2 // 3), (-2, -1, 1, 1), 100
+            ).convert('RGB').save(source, format='JPEG', quality=90)
+            cache = ImageVariantCache(
+                os.path.join(directory, 'cache'), 1024 * 1024 * 1024
+            )
+
+            misses = []
+            for _ in range(options['iterations']):
+                path = cache.variant_path(source, options['width'], 75)
+                if os.path.exists(path):
+                    os.remove(path)
+                start = time.perf_counter()
+                cache.get(source, options['width'], 75)
+                misses.append(time.perf_counter() - start)
+
+            hits = []
+            for _ in range(options['iterations']):
+                start = time.perf_counter()
+                cache.get(source, options['width'], 75)
+                hits.append(time.perf_counter() - start)
+        finally:
+            shutil.rmtree(directory)
+
+        self.stdout.write(f'miss: {_format(misses)}')
+        self.stdout.write(f'hit:  {_format(hits)}')
@@ -1,8 +1,109 @@
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Lower
+
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 from core.models import Tag, Ingredient, Recipe
+from core.sync import record_changes
+
+from recipe import autocomplete
+
+
+def get_or_create_by_names(model, user, names):
+    """Return the user's tags or ingredients named names, creating any new
+
+    Names match case-insensitively. Missing names are inserted in one
+    statement that ignores rows a concurrent request created first.
+    """
+    names = {name.lower(): name for name in reversed(names)}
+    if not names:
+        return []
+    found = list(model.objects.annotate(lower_name=Lower('name')).filter(
+        user=user, lower_name__in=names
+    ))
+    missing = set(names) - {obj.name.lower() for obj in found}
+    if missing:
+        model.objects.bulk_create(
+            [model(user=user, name=names[name]) for name in missing],
+            ignore_conflicts=True
+        )
+        created = list(model.objects.annotate(
+            lower_name=Lower('name')
+        ).filter(user=user, lower_name__in=missing))
+        record_changes(
+            user.id, model._meta.model_name, [obj.pk for obj in created]
+        )
+        autocomplete.invalidate(model, user.id)
+        found += created
+    return found
+
+
+class UniqueNameMixin:
+    """Reject names the user already has, ignoring case"""
+
+    def validate_name(self, value):
+        queryset = self.Meta.model.objects.annotate(
+            lower_name=Lower('name')
+        ).filter(user=self.context['request'].user, lower_name=value.lower())
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError('This name already exists.')
+        return value
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """Validates a list of primary keys with a single query"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks, errors = [], []
+        for item in data:
+            try:
+                if isinstance(item, bool):
+                    raise ValidationError('')
+                pks.append(pk_field.to_python(item))
+            except ValidationError:
+                errors.append(child.error_messages['incorrect_type'].format(
+                    data_type=type(item).__name__
+                ))
 
+        found = queryset.in_bulk(pks) if pks else {}
+        errors += [
+            child.error_messages['does_not_exist'].format(pk_value=pk)
+            for pk in pks if pk not in found
+        ]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [found[pk] for pk in dict.fromkeys(pks)]
 
-class TagSerializer(serializers.ModelSerializer):
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field limited to objects of the requesting user"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        if request is None:
+            return super().get_queryset().none()
+        return super().get_queryset().filter(user=request.user)
+
+
+class TagSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for tag object"""
     class Meta:
         model = Tag
@@ -10,7 +111,7 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for Ingredient Object"""
     class Meta:
         model = Ingredient
@@ -19,26 +120,75 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    """Serializer for Recipe"""
+    """Serializer for Recipe
+
+    New tags and ingredients can be given by name in tag_names and
+    ingredient_names, next to the ids of existing ones.
+    """
 
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
+        required=False,
         queryset=Ingredient.objects.all()
     )
 
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
+        required=False,
         queryset=Tag.objects.all()
     )
 
+    ingredient_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+        write_only=True
+    )
+
+    tag_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+        write_only=True
+    )
+
     class Meta:
         model = Recipe
         fields = (
             'id', 'title', 'ingredients', 'tags',
-            'time_minutes', 'price'
+            'time_minutes', 'price', 'ingredient_names', 'tag_names'
         )
         read_only_fields = ('id',)
 
+    def _resolve_names(self, validated_data, user, instance=None):
+        """Add the objects named by the *_names fields to their relation
+
+        Names add to the ids sent with them, or to the recipe's current
+        links when an update sends no ids.
+        """
+        for field, names_field, model in (
+            ('ingredients', 'ingredient_names', Ingredient),
+            ('tags', 'tag_names', Tag),
+        ):
+            names = validated_data.pop(names_field, None)
+            if names is None:
+                continue
+            if field in validated_data:
+                current = validated_data[field]
+            elif instance is not None:
+                current = list(getattr(instance, field).all())
+            else:
+                current = []
+            validated_data[field] = list(dict.fromkeys(
+                current + get_or_create_by_names(model, user, names)
+            ))
+
+    def create(self, validated_data):
+        self._resolve_names(validated_data, validated_data['user'])
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self._resolve_names(validated_data, instance.user, instance)
+        return super().update(instance, validated_data)
+
 
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for Recipe Detail"""
@@ -0,0 +1,101 @@
+from django.db.models.signals import m2m_changed, post_save, pre_delete, \
+                                     post_delete
+from django.dispatch import receiver
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import autocomplete, fragments, similarity
+
+
+def _fragments_changed(instance, action, reverse, pk_set):
+    if reverse and action == 'pre_clear':
+        instance._fragment_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        fragments.invalidate([instance.pk])
+    elif action == 'post_clear':
+        fragments.invalidate(
+            instance.__dict__.pop('_fragment_recipe_ids', [])
+        )
+    else:
+        fragments.invalidate(pk_set)
+
+
+def _features_changed(kind, instance, action, reverse, pk_set):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance is the tag or ingredient, rebuild rather than patch
+        similarity.invalidate(instance.user_id)
+    else:
+        similarity.patch(instance.user_id, instance.pk, kind, pk_set, action)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_changed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    """Keep the similarity index and fragments in step with ingredients"""
+    _features_changed('i', instance, action, reverse, pk_set)
+    _fragments_changed(instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    """Keep the similarity index and fragments in step with recipe tags"""
+    _features_changed('t', instance, action, reverse, pk_set)
+    _fragments_changed(instance, action, reverse, pk_set)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    """Drop the fragments of a recipe and index new ones"""
+    fragments.invalidate([instance.pk])
+    if created:
+        similarity.invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Drop the fragments and rebuild the index of a removed recipe"""
+    fragments.invalidate([instance.pk])
+    similarity.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def recipe_attribute_changed(sender, instance, **kwargs):
+    """Drop the cached autocomplete names of the owner"""
+    autocomplete.invalidate(sender, instance.user_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def recipe_attribute_saved(sender, instance, created, **kwargs):
+    """Drop the fragments showing a renamed tag or ingredient"""
+    if not created:
+        fragments.invalidate(
+            list(instance.recipe_set.values_list('id', flat=True))
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def recipe_attribute_deleting(sender, instance, **kwargs):
+    """Keep the recipes of a tag or ingredient about to be deleted"""
+    instance._fragment_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def recipe_attribute_deleted(sender, instance, **kwargs):
+    """Drop the fragments and index showing a deleted tag or ingredient"""
+    fragments.invalidate(instance.__dict__.pop('_fragment_recipe_ids', []))
+    # The cascade to the recipe links sends no m2m_changed
+    similarity.invalidate(instance.user_id)
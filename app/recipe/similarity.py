@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.metrics import record_cache
+from core.models import Recipe
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(words):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+else:
+    _BYTE_COUNTS = np.array(
+        [bin(i).count('1') for i in range(256)], dtype=np.uint8
+    )
+
+    def _popcount(words):
+        bytes_ = words.view(np.uint8).reshape(len(words), -1)
+        return _BYTE_COUNTS[bytes_].sum(axis=1, dtype=np.int64)
+
+
+def _version_key(user_id):
+    return f'recipe:similarity:version:{user_id}'
+
+
+class SimilarityIndex:
+    """Bitsets of the ingredients and tags of every recipe of one user
+
+    Row i holds the features of recipe_ids[i] packed into 64 bit words,
+    with ingredients and tags sharing one feature space.
+    """
+
+    def __init__(self, recipe_ids, features, pairs, version):
+        self.version = version
+        self.recipe_ids = np.array(recipe_ids, dtype=np.int64)
+        self.rows = {recipe_id: i for i, recipe_id in enumerate(recipe_ids)}
+        self.columns = {feature: i for i, feature in enumerate(features)}
+        self.words = np.zeros(
+            (len(recipe_ids), max(1, -(-len(features) // 64))),
+            dtype=np.uint64
+        )
+        if pairs:
+            rows, columns = np.array([
+                (self.rows[recipe_id], self.columns[feature])
+                for recipe_id, feature in pairs
+            ], dtype=np.int64).T
+            np.bitwise_or.at(
+                self.words,
+                (rows, columns // 64),
+                np.left_shift(np.uint64(1), (columns % 64).astype(np.uint64))
+            )
+
+    def set_features(self, recipe_id, features, present):
+        """Set or clear features of a recipe, False if a rebuild is needed"""
+        row = self.rows.get(recipe_id)
+        if row is None or any(f not in self.columns for f in features):
+            return False
+        for feature in features:
+            column = self.columns[feature]
+            bit = np.uint64(1) << np.uint64(column % 64)
+            if present:
+                self.words[row, column // 64] |= bit
+            else:
+                self.words[row, column // 64] &= ~bit
+        return True
+
+    def clear_features(self, recipe_id, kind):
+        """Clear every feature of one kind from a recipe"""
+        return self.set_features(
+            recipe_id,
+            [f for f in self.columns if f[0] == kind],
+            False
+        )
+
+    def similar(self, recipe_id, limit):
+        """Return (recipe id, Jaccard similarity) pairs, best first"""
+        row = self.rows.get(recipe_id)
+        if row is None:
+            return []
+        target = self.words[row]
+        intersection = _popcount(self.words & target)
+        union = _popcount(self.words | target)
+        scores = intersection / np.maximum(union, 1)
+        scores[row] = 0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        order = np.lexsort((self.recipe_ids[candidates], -scores[candidates]))
+        return [
+            (int(self.recipe_ids[i]), float(scores[i]))
+            for i in candidates[order]
+        ]
+
+
+def _build_index(user_id, version):
+    recipe_ids = list(Recipe.objects.filter(
+        user_id=user_id, pending_deletion=False
+    ).order_by('id').values_list('id', flat=True))
+    pairs = [
+        (recipe_id, ('i', ingredient_id))
+        for recipe_id, ingredient_id in Recipe.ingredients.through.objects
+        .filter(recipe__user_id=user_id, recipe__pending_deletion=False)
+        .values_list('recipe_id', 'ingredient_id')
+    ] + [
+        (recipe_id, ('t', tag_id))
+        for recipe_id, tag_id in Recipe.tags.through.objects
+        .filter(recipe__user_id=user_id, recipe__pending_deletion=False)
+        .values_list('recipe_id', 'tag_id')
+    ]
+    features = sorted({feature for _, feature in pairs})
+    return SimilarityIndex(recipe_ids, features, pairs, version)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(user_id):
+    """Return the user's index, rebuilding it if another process wrote"""
+    version = cache.get_or_set(_version_key(user_id), 1, None)
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None and index.version == version:
+            _indexes.move_to_end(user_id)
+            record_cache('similarity', True)
+            return index
+
+    record_cache('similarity', False)
+    index = _build_index(user_id, version)
+    with _indexes_lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > settings.RECIPE_SIMILARITY_CACHED_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def similar_recipes(user_id, recipe_id, limit):
+    """Return the recipes of a user most similar to recipe_id"""
+    return get_index(user_id).similar(recipe_id, limit)
+
+
+def _bump_version(user_id):
+    key = _version_key(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+        return 2
+
+
+def invalidate(user_id):
+    """Drop the user's index everywhere"""
+    _bump_version(user_id)
+    with _indexes_lock:
+        _indexes.pop(user_id, None)
+
+
+def patch(user_id, recipe_id, kind, feature_ids, action):
+    """Apply an m2m change to the cached index, or invalidate it"""
+    version = _bump_version(user_id)
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is None:
+            return
+        features = [(kind, feature_id) for feature_id in feature_ids or ()]
+        if action == 'post_clear':
+            patched = index.clear_features(recipe_id, kind)
+        else:
+            patched = index.set_features(
+                recipe_id, features, action == 'post_add'
+            )
+        if patched and index.version == version - 1:
+            index.version = version
+        else:
+            _indexes.pop(user_id, None)
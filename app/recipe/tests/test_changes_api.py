@@ -0,0 +1,144 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Change, Tag, Ingredient, Recipe
+from core.sync import compact_tombstones
+
+CHANGES_URL = reverse('recipe:change-list')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    default = {
+        'title': 'Sample title',
+        'time_minutes': 5,
+        'price': 5.0
+    }
+    default.update(params)
+    return Recipe.objects.create(user=user, **default)
+
+
+class PublicChangesAPITests(TestCase):
+    """Test the publicly available changes API"""
+
+    def test_login_required(self):
+        """Test that login is required for syncing"""
+        res = APIClient().get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateChangesAPITests(TestCase):
+    """Test the authorized user changes API"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com', 'simplepass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_full_sync(self):
+        """Test since=0 returns every object of the user"""
+        other = get_user_model().objects.create_user(
+            'ratnakar@gmail.com', 'sample123'
+        )
+        Tag.objects.create(user=other, name='Vegan')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(tag)
+
+        res = self.client.get(CHANGES_URL, {'since': 0})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(c['type'], c['id']) for c in res.data['changes']],
+            [('tag', tag.id), ('recipe', recipe.id)]
+        )
+        self.assertEqual(res.data['changes'][1]['data']['tags'], [tag.id])
+        self.assertFalse(res.data['more'])
+
+    def test_delta_sync(self):
+        """Test only objects changed since the last sync are returned"""
+        recipe = sample_recipe(self.user)
+        unchanged = sample_recipe(self.user)
+        seq = self.client.get(CHANGES_URL).data['seq']
+
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Salt')
+        )
+        unchanged.delete()
+
+        res = self.client.get(CHANGES_URL, {'since': seq})
+
+        changes = [
+            (c['type'], c['deleted']) for c in res.data['changes']
+        ]
+        self.assertEqual(
+            changes,
+            [('ingredient', False), ('recipe', False), ('recipe', True)]
+        )
+        self.assertIsNone(res.data['changes'][2]['data'])
+        self.assertGreater(res.data['seq'], seq)
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_paginated(self):
+        """Test changes are returned in pages following seq"""
+        recipes = [sample_recipe(self.user) for _ in range(3)]
+
+        res = self.client.get(CHANGES_URL)
+        self.assertEqual(len(res.data['changes']), 2)
+        self.assertTrue(res.data['more'])
+
+        res = self.client.get(CHANGES_URL, {'since': res.data['seq']})
+        self.assertEqual(
+            [c['id'] for c in res.data['changes']], [recipes[2].id]
+        )
+        self.assertFalse(res.data['more'])
+
+    @override_settings(DEFERRED_DELETION=True)
+    def test_deferred_deletion_tombstone(self):
+        """Test recipes waiting for deletion are reported as deleted"""
+        recipe = sample_recipe(self.user)
+        seq = self.client.get(CHANGES_URL).data['seq']
+
+        self.client.delete(reverse('recipe:recipe-detail', args=[recipe.id]))
+
+        res = self.client.get(CHANGES_URL, {'since': seq})
+        self.assertEqual(len(res.data['changes']), 1)
+        self.assertTrue(res.data['changes'][0]['deleted'])
+
+    def test_compacted_tombstones_reset(self):
+        """Test clients behind compacted tombstones are told to reset"""
+        recipe = sample_recipe(self.user)
+        seq = self.client.get(CHANGES_URL).data['seq']
+        recipe.delete()
+        sample_recipe(self.user)
+        Change.objects.filter(deleted=True).update(
+            changed=timezone.now() - timedelta(days=60)
+        )
+
+        self.assertEqual(compact_tombstones(30 * 24 * 60 * 60), 1)
+
+        res = self.client.get(CHANGES_URL, {'since': seq})
+        self.assertTrue(res.data['reset'])
+        res = self.client.get(CHANGES_URL, {'since': 0})
+        self.assertEqual(len(res.data['changes']), 1)
+        self.assertFalse(res.data['reset'])
+
+    def test_deleted_user_log_removed(self):
+        """Test the change log goes away with its user"""
+        sample_recipe(self.user).tags.add(
+            Tag.objects.create(user=self.user, name='Vegan')
+        )
+
+        self.user.delete()
+
+        self.assertFalse(Change.objects.exists())
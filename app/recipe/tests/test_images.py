@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.test import SimpleTestCase
+
+from recipe.images import ImageVariantCache, TRIM_LOW_WATER
+
+
+class ImageVariantCacheTests(SimpleTestCase):
+    """Test the resized image disk cache"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'source.jpg')
+        Image.new('RGB', (400, 200)).save(self.source, format='JPEG')
+        self.cache = ImageVariantCache(
+            os.path.join(self.directory, 'cache'),
+            max_bytes=10 * 1024 * 1024
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_miss_then_hit(self):
+        """Test a variant is resized once and served from disk after"""
+        with patch.object(
+            self.cache, '_resize', wraps=self.cache._resize
+        ) as resize:
+            path = self.cache.get(self.source, 100, 75)
+            self.assertEqual(self.cache.get(self.source, 100, 75), path)
+
+        self.assertEqual(resize.call_count, 1)
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (100, 50))
+
+    def test_never_upscales(self):
+        """Test widths larger than the source keep the source size"""
+        path = self.cache.get(self.source, 1000, 75)
+
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (400, 200))
+
+    def test_concurrent_misses_coalesced(self):
+        """Test concurrent requests for one variant resize only once"""
+        with patch.object(
+            self.cache, '_resize', wraps=self.cache._resize
+        ) as resize:
+            threads = [
+                threading.Thread(
+                    target=self.cache.get, args=(self.source, 200, 75)
+                )
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(resize.call_count, 1)
+
+    def test_open_resizes_evicted_variant(self):
+        """Test a variant evicted after its lookup is resized again"""
+        get = self.cache.get
+        evicted = []
+
+        def get_then_evict(*args):
+            path = get(*args)
+            if not evicted:
+                evicted.append(path)
+                os.remove(path)
+            return path
+
+        with patch.object(self.cache, 'get', side_effect=get_then_evict):
+            with self.cache.open(self.source, 100, 75) as variant:
+                with Image.open(variant) as image:
+                    self.assertEqual(image.size, (100, 50))
+
+    def test_trim_evicts_least_recently_used(self):
+        """Test trimming removes the oldest variants first"""
+        old = self.cache.get(self.source, 100, 75)
+        new = self.cache.get(self.source, 200, 75)
+        os.utime(old, (1, 1))
+        self.cache.max_bytes = int(
+            (os.path.getsize(new) + 1) / TRIM_LOW_WATER
+        )
+
+        self.cache.trim()
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
@@ -10,6 +10,7 @@ from core.models import Ingredient, Recipe
 from recipe.serializers import IngredientSerializer
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+INGREDIENTS_AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
 
 
 class PublicIngredientsAPITests(TestCase):
@@ -140,3 +141,24 @@ class PrivateIngredientsAPITests(TestCase):
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res.data), 1)
+
+    def test_autocomplete_search(self):
+        """Test names starting with q come before names containing it"""
+        Ingredient.objects.create(user=self.user, name='Brown rice')
+        Ingredient.objects.create(user=self.user, name='Rice flour')
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(
+            INGREDIENTS_AUTOCOMPLETE_URL, {'q': 'rice', 'limit': 5}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [i['name'] for i in res.data], ['Rice flour', 'Brown rice']
+        )
+
+    def test_autocomplete_requires_text(self):
+        """Test autocomplete without prefix or q is rejected"""
+        res = self.client.get(INGREDIENTS_AUTOCOMPLETE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
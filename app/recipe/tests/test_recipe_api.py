@@ -1,3 +1,4 @@
+import io
 import tempfile
 import os
 from PIL import Image
@@ -5,10 +6,13 @@ from PIL import Image
 from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.test import APIClient
 
 from core import models
@@ -17,6 +21,7 @@ from core.models import Recipe, Tag, Ingredient
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 RECIPE_URL = reverse('recipe:recipe-list')
+RECIPE_BATCH_URL = reverse('recipe:recipe-batch')
 
 
 def image_upload_url(recipe_id):
@@ -24,6 +29,11 @@ def image_upload_url(recipe_id):
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def image_resize_url(recipe_id):
+    """Return recipe resized image url"""
+    return reverse('recipe:recipe-image', args=[recipe_id])
+
+
 def get_recipe_detail_url(recipe_id):
     """Return recipe detail url"""
     return reverse('recipe:recipe-detail', args=[recipe_id])
@@ -213,6 +223,94 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_create_recipe_with_tag_and_ingredient_names(self):
+        """Test new and existing tags and ingredients can be given by name"""
+        garlic = sample_ingredient(self.user, name='Garlic')
+        payload = {
+            'title': 'Garlic naan',
+            'time_minutes': 30,
+            'price': 3.0,
+            'tag_names': ['Bread', 'bread'],
+            'ingredient_names': ['garlic', 'Flour'],
+        }
+
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(
+            [tag.name for tag in recipe.tags.all()], ['Bread']
+        )
+        self.assertEqual(
+            sorted(i.name for i in recipe.ingredients.all()),
+            ['Flour', 'Garlic']
+        )
+        self.assertIn(garlic.id, res.data['ingredients'])
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 2)
+        self.assertNotIn('tag_names', res.data)
+
+    def test_create_recipe_with_names_constant_queries(self):
+        """Test the queries for names do not grow with their number"""
+        sample_recipe(self.user)
+
+        def post(count):
+            payload = {
+                'title': 'Sample title',
+                'time_minutes': 5,
+                'price': 5.0,
+                'tag_names': [f'Tag {count} {i}' for i in range(count)],
+                'ingredient_names': [
+                    f'Ingredient {count} {i}' for i in range(count)
+                ],
+            }
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(RECIPE_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+
+        self.assertEqual(post(1), post(10))
+
+    def test_create_recipe_ids_validated_in_one_query(self):
+        """Test ingredient ids are looked up together, not one by one"""
+        def post(count):
+            ingredients = [
+                sample_ingredient(self.user, name=f'Ingredient {count} {i}')
+                for i in range(count)
+            ]
+            payload = {
+                'title': 'Sample title',
+                'time_minutes': 5,
+                'price': 5.0,
+                'ingredients': [i.id for i in ingredients],
+            }
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(RECIPE_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(queries)
+
+        self.assertEqual(post(1), post(30))
+
+    def test_create_recipe_invalid_ids(self):
+        """Test other users' and malformed ids are all reported"""
+        user2 = get_user_model().objects.create_user(
+            'ratnakar@gmail.com',
+            'sample123'
+        )
+        own = sample_tag(self.user)
+        other = sample_tag(user2)
+        payload = {
+            'title': 'Sample title',
+            'time_minutes': 5,
+            'price': 5.0,
+            'tags': [own.id, other.id, 'abc', 99999],
+        }
+
+        res = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data['tags']), 3)
+        self.assertFalse(Recipe.objects.exists())
+
     def test_partial_update_recipe(self):
         """Test updating a recipe model using patch"""
         recipe = sample_recipe(self.user)
@@ -236,6 +334,18 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(len(tags), 1)
         self.assertIn(new_tag, tags)
 
+    def test_partial_update_adds_names(self):
+        """Test names sent without ids add to the recipe's links"""
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(sample_tag(self.user, 'Keep'))
+        url = get_recipe_detail_url(recipe.id)
+
+        self.client.patch(url, {'tag_names': ['New']}, format='json')
+
+        self.assertEqual(
+            sorted(tag.name for tag in recipe.tags.all()), ['Keep', 'New']
+        )
+
     def test_full_update_recipe(self):
         """test updating a recipe model using put"""
         recipe = sample_recipe(self.user)
@@ -304,6 +414,93 @@ class RecipeImageUploadTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+@override_settings(RECIPE_IMAGE_CACHE_DIR=tempfile.mkdtemp())
+class RecipeImageResizeTests(TestCase):
+    """Test Recipe resized image end point"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'simplepassword'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (800, 400)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': ntf},
+                format='multipart'
+            )
+        self.recipe.refresh_from_db()
+
+    def tearDown(self):
+        if os.path.exists(self.recipe.image.path):
+            self.recipe.image.delete()
+
+    def test_resize_image(self):
+        """Test the image is returned at the requested width"""
+        res = self.client.get(
+            image_resize_url(self.recipe.id),
+            {'width': 320, 'quality': 50}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        image = Image.open(io.BytesIO(b''.join(res.streaming_content)))
+        self.assertEqual(image.size, (320, 160))
+
+    def test_resize_revalidated(self):
+        """Test resized images are revalidated and change with the image"""
+        url = image_resize_url(self.recipe.id)
+        res = self.client.get(url, {'width': 320})
+        etag = res['ETag']
+
+        self.assertNotIn('immutable', res['Cache-Control'])
+        self.assertEqual(
+            self.client.get(
+                url, {'width': 320}, HTTP_IF_NONE_MATCH=etag
+            ).status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (640, 640)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': ntf},
+                format='multipart'
+            )
+        self.recipe.refresh_from_db()
+        res = self.client.get(url, {'width': 320}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_resize_missing_source(self):
+        """Test a recipe whose image file is gone returns not found"""
+        os.remove(self.recipe.image.path)
+
+        res = self.client.get(image_resize_url(self.recipe.id), {'width': 320})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_resize_invalid_width(self):
+        """Test widths outside the allowed set are rejected"""
+        res = self.client.get(
+            image_resize_url(self.recipe.id),
+            {'width': 321}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_resize_without_image(self):
+        """Test resizing a recipe without image returns not found"""
+        recipe = sample_recipe(self.user)
+        res = self.client.get(image_resize_url(recipe.id), {'width': 320})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class RecipeFilterTests(TestCase):
     """Test Recipe Filter APIs"""
     def setUp(self):
@@ -362,3 +559,360 @@ class RecipeFilterTests(TestCase):
         self.assertIn(serializer1.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+    def test_filter_recipe_by_time_and_price(self):
+        """Test returning recipes within time and price ranges"""
+        quick = sample_recipe(self.user, time_minutes=10, price=8.0)
+        sample_recipe(self.user, time_minutes=45, price=8.0)
+        sample_recipe(self.user, time_minutes=20, price=12.5)
+
+        res = self.client.get(
+            RECIPE_URL, {'max_time': 30, 'max_price': '10.00'}
+        )
+
+        self.assertEqual([r['id'] for r in res.data], [quick.id])
+
+    def test_order_recipes_by_price(self):
+        """Test recipes can be ordered by price with ties broken by id"""
+        dear = sample_recipe(self.user, price=20.0)
+        cheap1 = sample_recipe(self.user, price=4.0)
+        cheap2 = sample_recipe(self.user, price=4.0)
+
+        res = self.client.get(RECIPE_URL, {'ordering': 'price'})
+        self.assertEqual(
+            [r['id'] for r in res.data], [cheap1.id, cheap2.id, dear.id]
+        )
+
+        res = self.client.get(
+            RECIPE_URL, {'ordering': '-price', 'min_price': 5}
+        )
+        self.assertEqual([r['id'] for r in res.data], [dear.id])
+
+    def test_invalid_range_and_ordering(self):
+        """Test malformed ranges and unknown orderings are rejected"""
+        res = self.client.get(RECIPE_URL, {'max_time': 'soon'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(RECIPE_URL, {'ordering': 'title'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeBatchTests(TestCase):
+    """Test Recipe batch retrieve API"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'samplepassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_batch_retrieve_preserves_order(self):
+        """Test batch retrieve returns details in requested order"""
+        recipe1 = sample_recipe(self.user, title='Chicken curry')
+        recipe2 = sample_recipe(self.user, title='Veg thali')
+        recipe2.tags.add(sample_tag(self.user))
+        recipe2.ingredients.add(sample_ingredient(self.user))
+
+        res = self.client.get(
+            RECIPE_BATCH_URL,
+            {'ids': f'{recipe2.id},{recipe1.id}'}
+        )
+
+        serializer = RecipeDetailSerializer([recipe2, recipe1], many=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], serializer.data)
+        self.assertEqual(res.data['missing'], [])
+
+    def test_batch_retrieve_reports_missing(self):
+        """Test unknown and other users' ids are reported as missing"""
+        user2 = get_user_model().objects.create_user(
+            'ratnakar@gmail.com',
+            'sample123'
+        )
+        recipe = sample_recipe(self.user)
+        other_recipe = sample_recipe(user2)
+
+        res = self.client.get(
+            RECIPE_BATCH_URL,
+            {'ids': f'{recipe.id},{other_recipe.id},99999'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['missing'], [other_recipe.id, 99999])
+
+    def test_batch_retrieve_invalid_ids(self):
+        """Test batch retrieve rejects malformed id lists"""
+        res = self.client.get(RECIPE_BATCH_URL, {'ids': '1,abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_retrieve_too_many_ids(self):
+        """Test batch retrieve rejects more ids than allowed"""
+        ids = ','.join(str(i) for i in range(1, 102))
+        res = self.client.get(RECIPE_BATCH_URL, {'ids': ids})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(DEFERRED_DELETION=True)
+    def test_batch_delete(self):
+        """Test batch delete hides the recipes until they are deleted"""
+        recipe1 = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+
+        res = self.client.delete(f'{RECIPE_BATCH_URL}?ids={recipe1.id}')
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual([r['id'] for r in res.data], [recipe2.id])
+        self.assertTrue(Recipe.objects.filter(id=recipe1.id).exists())
+
+
+class RecipeSimilarTests(TestCase):
+    """Test the similar recipes API"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'samplepassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_similar_recipes(self):
+        """Test similar recipes are returned best first with a score"""
+        tag = sample_tag(self.user)
+        ingredient = sample_ingredient(self.user)
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+        close = sample_recipe(self.user, title='Close')
+        close.tags.add(tag)
+        close.ingredients.add(ingredient)
+        far = sample_recipe(self.user, title='Far')
+        far.tags.add(tag)
+        sample_recipe(self.user, title='Unrelated')
+
+        url = reverse('recipe:recipe-similar', args=[recipe.id])
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [close.id, far.id])
+        self.assertEqual([r['similarity'] for r in res.data], [1.0, 0.5])
+        self.assertEqual(res.data[0]['title'], 'Close')
+
+    def test_similar_recipes_of_other_user(self):
+        """Test similar recipes of another user's recipe are not found"""
+        user2 = get_user_model().objects.create_user(
+            'ratnakar@gmail.com',
+            'sample123'
+        )
+        recipe = sample_recipe(user2)
+
+        url = reverse('recipe:recipe-similar', args=[recipe.id])
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipePantryTests(TestCase):
+    """Test the pantry recipe search API"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'samplepassword'
+        )
+        self.client.force_authenticate(self.user)
+        self.rice = sample_ingredient(self.user, name='Rice')
+        self.dal = sample_ingredient(self.user, name='Dal')
+        self.ghee = sample_ingredient(self.user, name='Ghee')
+        self.khichdi = sample_recipe(self.user, title='Khichdi')
+        self.khichdi.ingredients.add(self.rice, self.dal)
+        self.ghee_rice = sample_recipe(self.user, title='Ghee rice')
+        self.ghee_rice.ingredients.add(self.rice, self.ghee)
+        self.dal_tadka = sample_recipe(self.user, title='Dal tadka')
+        self.dal_tadka.ingredients.add(self.dal, self.ghee)
+
+    def test_pantry_fully_covered(self):
+        """Test only recipes with every ingredient available are returned"""
+        res = self.client.get(
+            reverse('recipe:recipe-pantry'),
+            {'ingredients': f'{self.rice.id},{self.dal.id}'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [self.khichdi.id])
+        self.assertEqual(res.data[0]['missing_ingredients'], [])
+
+    def test_pantry_missing_ingredients(self):
+        """Test near matches are ranked by the number missing"""
+        res = self.client.get(
+            reverse('recipe:recipe-pantry'),
+            {'ingredients': f'{self.rice.id},{self.dal.id}', 'missing': 1}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r['id'] for r in res.data],
+            [self.khichdi.id, self.dal_tadka.id, self.ghee_rice.id]
+        )
+        self.assertEqual(res.data[1]['missing_ingredients'], [self.ghee.id])
+
+    def test_pantry_invalid_params(self):
+        """Test the pantry search rejects malformed parameters"""
+        url = reverse('recipe:recipe-pantry')
+
+        res = self.client.get(url, {'ingredients': 'rice'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(url, {'ingredients': '1', 'missing': 99})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeShoppingListTests(TestCase):
+    """Test the shopping list API"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'samplepassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_shopping_list(self):
+        """Test ingredients are merged and totals summed across recipes"""
+        rice = sample_ingredient(self.user, name='Rice')
+        dal = sample_ingredient(self.user, name='Dal')
+        recipe1 = sample_recipe(self.user, time_minutes=20, price=4.5)
+        recipe1.ingredients.add(rice, dal)
+        recipe2 = sample_recipe(self.user, time_minutes=10, price=2.25)
+        recipe2.ingredients.add(rice)
+        other = sample_recipe(get_user_model().objects.create_user(
+            'ratnakar@gmail.com',
+            'sample123'
+        ))
+
+        with self.assertNumQueries(2):
+            res = self.client.get(
+                reverse('recipe:recipe-shopping-list'),
+                {'ids': f'{recipe1.id},{recipe2.id},{other.id}'}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['ingredients'], [
+            {'id': dal.id, 'name': 'Dal', 'recipes': 1},
+            {'id': rice.id, 'name': 'Rice', 'recipes': 2},
+        ])
+        self.assertEqual(res.data['recipes'], 2)
+        self.assertEqual(float(res.data['price']), 6.75)
+        self.assertEqual(res.data['time_minutes'], 30)
+
+    def test_shopping_list_invalid_ids(self):
+        """Test the shopping list rejects malformed id lists"""
+        res = self.client.get(
+            reverse('recipe:recipe-shopping-list'), {'ids': 'abc'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeFragmentCacheTests(TestCase):
+    """Test recipes are served from cached representations"""
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'samplepassword'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_serializes_only_changed(self):
+        """Test an unchanged list needs one query and changes show up"""
+        recipe1 = sample_recipe(self.user, title='Poha')
+        recipe2 = sample_recipe(self.user, title='Upma')
+        recipe2.tags.add(sample_tag(self.user))
+        self.client.get(RECIPE_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(RECIPE_URL)
+        recipe1.title = 'Kanda poha'
+        recipe1.save()
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(len(queries), 4)
+        recipes = Recipe.objects.order_by('-id').prefetch_related('tags')
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data[1]['title'], 'Kanda poha')
+
+    def test_detail_follows_links(self):
+        """Test adding and renaming a tag updates the cached detail"""
+        recipe = sample_recipe(self.user)
+        tag = sample_tag(self.user, name='Vegan')
+        url = get_recipe_detail_url(recipe.id)
+        self.client.get(url)
+
+        recipe.tags.add(tag)
+        self.assertEqual(
+            self.client.get(url).data['tags'],
+            [{'id': tag.id, 'name': 'Vegan'}]
+        )
+        tag.name = 'Vegetarian'
+        tag.save()
+        self.assertEqual(
+            self.client.get(url).data['tags'],
+            [{'id': tag.id, 'name': 'Vegetarian'}]
+        )
+        tag.delete()
+        self.assertEqual(self.client.get(url).data['tags'], [])
+
+    def test_detail_not_found(self):
+        """Test other users' and missing recipes are not served"""
+        other = sample_recipe(get_user_model().objects.create_user(
+            'ratnakar@gmail.com',
+            'sample123'
+        ))
+
+        res = self.client.get(get_recipe_detail_url(other.id))
+        missing = self.client.get(get_recipe_detail_url('abc'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cached_recipe_not_served_to_other_user(self):
+        """Test a fragment cached for the owner is not served to others"""
+        recipe = sample_recipe(self.user)
+        self.client.get(get_recipe_detail_url(recipe.id))
+        self.client.get(RECIPE_BATCH_URL, {'ids': recipe.id})
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user(
+            'ratnakar@gmail.com',
+            'sample123'
+        ))
+
+        res = other.get(get_recipe_detail_url(recipe.id))
+        batch = other.get(RECIPE_BATCH_URL, {'ids': recipe.id})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(batch.data['results'], [])
+        self.assertEqual(batch.data['missing'], [recipe.id])
+
+    def test_list_page_fetches_page_ids(self):
+        """Test a paginated list only fetches the ids of its page"""
+        recipes = [sample_recipe(self.user) for _ in range(3)]
+
+        with patch(
+            'recipe.views.RecipeViewSet.pagination_class',
+            LimitOffsetPagination
+        ), CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPE_URL, {'limit': 1, 'offset': 1})
+
+        self.assertEqual(res.data['count'], 3)
+        self.assertEqual(
+            [r['id'] for r in res.data['results']], [recipes[1].id]
+        )
+        self.assertTrue(any(
+            'LIMIT 1' in query['sql'] for query in queries.captured_queries
+        ))
@@ -0,0 +1,104 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe import similarity
+
+
+class SimilarRecipesTests(TestCase):
+    """Test the similar recipes bitset index"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'rsratna24@gmail.com',
+            'samplepassword'
+        )
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'Ingredient {i}')
+            for i in range(70)
+        ]
+        self.tag = Tag.objects.create(user=self.user, name='Dinner')
+
+    def _recipe(self, ingredients, tags=()):
+        recipe = Recipe.objects.create(
+            user=self.user, title='Sample', time_minutes=5, price=5
+        )
+        recipe.ingredients.add(*ingredients)
+        recipe.tags.add(*tags)
+        return recipe
+
+    def test_ranked_by_jaccard_similarity(self):
+        """Test recipes are ranked by shared ingredients and tags"""
+        recipe = self._recipe(self.ingredients[:4], [self.tag])
+        close = self._recipe(self.ingredients[:4])
+        far = self._recipe(self.ingredients[3:8])
+        self._recipe(self.ingredients[60:])
+
+        res = similarity.similar_recipes(self.user.id, recipe.id, 10)
+
+        self.assertEqual(res, [(close.id, 0.8), (far.id, 1 / 9)])
+
+    def test_limit(self):
+        """Test only the best limit recipes are returned"""
+        recipe = self._recipe(self.ingredients[:10])
+        others = [self._recipe(self.ingredients[:i]) for i in range(1, 10)]
+
+        res = similarity.similar_recipes(self.user.id, recipe.id, 3)
+
+        self.assertEqual(
+            [recipe_id for recipe_id, _ in res],
+            [others[8].id, others[7].id, others[6].id]
+        )
+
+    def test_index_patched_on_change(self):
+        """Test ingredient changes are applied without a rebuild"""
+        recipe = self._recipe(self.ingredients[:2])
+        other = self._recipe(self.ingredients[66:68])
+        index = similarity.get_index(self.user.id)
+        self.assertEqual(
+            similarity.similar_recipes(self.user.id, recipe.id, 10), []
+        )
+
+        other.ingredients.add(self.ingredients[0])
+        self.assertIs(similarity.get_index(self.user.id), index)
+        self.assertEqual(
+            similarity.similar_recipes(self.user.id, recipe.id, 10),
+            [(other.id, 0.25)]
+        )
+
+        other.ingredients.clear()
+        self.assertEqual(
+            similarity.similar_recipes(self.user.id, recipe.id, 10), []
+        )
+
+    def test_new_feature_rebuilds_index(self):
+        """Test adding an ingredient unknown to the index rebuilds it"""
+        recipe = self._recipe(self.ingredients[:2])
+        other = self._recipe([])
+        index = similarity.get_index(self.user.id)
+
+        other.ingredients.add(self.ingredients[1], self.ingredients[69])
+
+        self.assertIsNot(similarity.get_index(self.user.id), index)
+        self.assertEqual(
+            similarity.similar_recipes(self.user.id, recipe.id, 10),
+            [(other.id, 1 / 3)]
+        )
+
+    def test_deleted_feature_rebuilds_index(self):
+        """Test deleting an ingredient drops it from the index"""
+        recipe = self._recipe(self.ingredients[:2])
+        other = self._recipe(self.ingredients[1:3])
+        index = similarity.get_index(self.user.id)
+        self.assertEqual(
+            similarity.similar_recipes(self.user.id, recipe.id, 10),
+            [(other.id, 1 / 3)]
+        )
+
+        self.ingredients[1].delete()
+
+        self.assertIsNot(similarity.get_index(self.user.id), index)
+        self.assertEqual(
+            similarity.similar_recipes(self.user.id, recipe.id, 10), []
+        )
@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -10,6 +10,7 @@ from core.models import Tag, Recipe
 from recipe.serializers import TagSerializer
 
 TAG_URL = reverse('recipe:tag-list')
+TAG_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 class PublicTagsAPITest(TestCase):
@@ -76,6 +77,15 @@ class PrivateTagsAPITest(TestCase):
 
         self.assertTrue(exists)
 
+    def test_create_duplicate_tag(self):
+        """Test a tag differing only in case is rejected"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAG_URL, {'name': 'VEGAN'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
     def test_create_tag_with_invalid_name(self):
         """Test that the tag is not created with empty name"""
         payload = {'name': ''}
@@ -129,3 +139,49 @@ class PrivateTagsAPITest(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res.data), 1)
+
+    def test_autocomplete_prefix(self):
+        """Test tag names are completed from a prefix"""
+        user2 = get_user_model().objects.create_user(
+            'ratnakar@gmail.com', 'sample123'
+        )
+        Tag.objects.create(user=user2, name='Vegetarian')
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        veg = Tag.objects.create(user=self.user, name='veg')
+        Tag.objects.create(user=self.user, name='Dessert')
+
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'prefix': 'VEG'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': veg.id, 'name': 'veg'},
+            {'id': vegan.id, 'name': 'Vegan'},
+        ])
+
+    def test_autocomplete_sees_new_tags(self):
+        """Test the cached names follow created and deleted tags"""
+        Tag.objects.create(user=self.user, name='Breakfast')
+        self.client.get(TAG_AUTOCOMPLETE_URL, {'prefix': 'b'})
+        brunch = Tag.objects.create(user=self.user, name='Brunch')
+
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'prefix': 'br'})
+        self.assertEqual(len(res.data), 2)
+
+        brunch.delete()
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'prefix': 'br'})
+        self.assertEqual([t['name'] for t in res.data], ['Breakfast'])
+
+    @override_settings(RECIPE_AUTOCOMPLETE_MAX_NAMES=1)
+    def test_autocomplete_from_database(self):
+        """Test users with many tags are answered from the database"""
+        Tag.objects.create(user=self.user, name='Main course')
+        Tag.objects.create(user=self.user, name='Drinks')
+        snacks = Tag.objects.create(user=self.user, name='Snacks')
+
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'q': 'in'})
+
+        self.assertEqual(
+            [t['name'] for t in res.data], ['Drinks', 'Main course']
+        )
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'prefix': 'sn'})
+        self.assertEqual(res.data, [{'id': snacks.id, 'name': 'Snacks'}])
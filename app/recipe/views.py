@@ -1,18 +1,35 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Lower
+from django.http import FileResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
-from core.models import Tag, Ingredient, Recipe
-from recipe import serializers
+from core.authentication import CachedTokenAuthentication
+from core.deletion import schedule_recipe_deletion
+from core.events import EVENTS_PATH, TICKET_COOKIE, issue_ticket
+from core.jobs import enqueue
+from core.models import Tag, Ingredient, Recipe, Change, SyncSequence
+from recipe import fragments, serializers
+from recipe.autocomplete import get_name_index
+from recipe.images import get_variant_cache, warm_recipe_image
+from recipe.similarity import similar_recipes
 
 
 class BaseRecipeAttributesViewSet(viewsets.GenericViewSet,
                                   mixins.ListModelMixin,
                                   mixins.CreateModelMixin):
     """Manage attributes of recipe model"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
@@ -22,7 +39,7 @@ class BaseRecipeAttributesViewSet(viewsets.GenericViewSet,
             int(self.request.query_params.get('assigned_only', 0))
         )
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = queryset.filter(recipe__pending_deletion=False)
         return queryset.filter(
             user=self.request.user
         ).order_by('-name').distinct()
@@ -30,6 +47,47 @@ class BaseRecipeAttributesViewSet(viewsets.GenericViewSet,
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """Return names starting with ?prefix= or containing ?q="""
+        prefix = request.query_params.get('prefix')
+        text = request.query_params.get('q')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response(
+                {'limit': ['Expected an integer.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not prefix and not text:
+            return Response(
+                {'prefix': ['Expected prefix or q.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        model = self.queryset.model
+        index = get_name_index(model, request.user.id)
+        if index is not None and prefix:
+            return Response(index.prefix(prefix, limit))
+        if index is not None:
+            return Response(index.search(text, limit))
+
+        names = model.objects.filter(user=request.user).order_by(
+            Lower('name'), 'id'
+        )
+        if prefix:
+            matches = list(names.filter(name__istartswith=prefix).values(
+                'id', 'name'
+            )[:limit])
+        else:
+            matches = list(names.filter(name__istartswith=text).values(
+                'id', 'name'
+            )[:limit])
+            matches += names.filter(name__icontains=text).exclude(
+                name__istartswith=text
+            ).values('id', 'name')[:limit - len(matches)]
+        return Response(matches)
+
 
 class TagViewSet(BaseRecipeAttributesViewSet):
     """Manage tags in the database"""
@@ -45,10 +103,27 @@ class IngredientViewSet(BaseRecipeAttributesViewSet):
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Manage recipe in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.filter(pending_deletion=False)
     serializer_class = serializers.RecipeSerializer
+    batch_max_ids = 100
+    pantry_max_missing = 5
+    range_filters = (
+        ('min_time', 'time_minutes__gte', int),
+        ('max_time', 'time_minutes__lte', int),
+        ('min_price', 'price__gte', Decimal),
+        ('max_price', 'price__lte', Decimal),
+    )
+    # Each ordering ends with id and matches a (user, column, id) index
+    orderings = {
+        '-id': ('-id',),
+        'id': ('id',),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'time_minutes': ('time_minutes', 'id'),
+        '-time_minutes': ('-time_minutes', '-id'),
+    }
 
     def _convert_str_list_to_int(self, parameters):
         """Convert given string ids to int ids"""
@@ -68,20 +143,76 @@ class RecipeViewSet(viewsets.ModelViewSet):
             ingredients_id = self._convert_str_list_to_int(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingredients_id)
 
-        return queryset.filter(user=self.request.user).order_by('-id')
+        for param, lookup, convert in self.range_filters:
+            value = self.request.query_params.get(param)
+            if value is not None:
+                try:
+                    queryset = queryset.filter(**{lookup: convert(value)})
+                except (ValueError, ArithmeticError):
+                    raise ValidationError({param: ['Expected a number.']})
+
+        ordering = self.request.query_params.get('ordering', '-id')
+        if ordering not in self.orderings:
+            raise ValidationError({'ordering': list(self.orderings)})
+
+        return queryset.filter(user=self.request.user).order_by(
+            *self.orderings[ordering]
+        )
 
     def get_serializer_class(self):
         """Get appropriate serializer class according action"""
-        if self.action == "retrieve":
+        if self.action in ("retrieve", "batch"):
             return serializers.RecipeDetailSerializer
         elif self.action == "upload_image":
             return serializers.RecipeImageSerializer
         return self.serializer_class
 
+    def _render(self, recipe_ids):
+        """Return the cached representations of the user's recipe_ids
+
+        Fragments are not checked for ownership, so recipe_ids must come
+        from get_queryset().
+        """
+        serializer_class = self.get_serializer_class()
+
+        def serialize(missing):
+            recipes = self.queryset.filter(
+                user=self.request.user, id__in=missing
+            ).prefetch_related('tags', 'ingredients')
+            return self.get_serializer(recipes, many=True).data
+
+        return fragments.render(
+            serializer_class.__name__, recipe_ids, serialize
+        )
+
+    def list(self, request, *args, **kwargs):
+        """List recipes, serializing only those not cached"""
+        queryset = self.filter_queryset(self.get_queryset())
+        recipe_ids = queryset.values_list('id', flat=True)
+        page = self.paginate_queryset(recipe_ids)
+        if page is not None:
+            return self.get_paginated_response(self._render(list(page)))
+        return Response(self._render(list(recipe_ids)))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return a recipe, from its cached representation if possible"""
+        recipe_id = get_object_or_404(
+            self.get_queryset().values_list('id', flat=True),
+            pk=kwargs['pk']
+        )
+        data = self._render([recipe_id])
+        if not data:
+            raise Http404
+        return Response(data[0])
+
     def perform_create(self, serializer):
         """Saves the Recipe object with the authenticated user"""
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        """Deletes the recipe, in the background if deletion is deferred"""
+        schedule_recipe_deletion(self.request.user, [instance.id])
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Saves an image to recipe object"""
@@ -93,6 +224,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         if serializer.is_valid():
             serializer.save()
+            if settings.RECIPE_IMAGE_WARM_WIDTHS:
+                enqueue(warm_recipe_image, recipe.id)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -101,3 +234,301 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    def _get_batch_ids(self, request):
+        """Return the unique ?ids= recipe ids, or an error response"""
+        ids = request.query_params.get('ids', '')
+        try:
+            recipe_ids = list(dict.fromkeys(
+                self._convert_str_list_to_int(ids)
+            ))
+        except ValueError:
+            return None, Response(
+                {'ids': ['Expected a comma separated list of integers.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if len(recipe_ids) > self.batch_max_ids:
+            return None, Response(
+                {'ids': [f'At most {self.batch_max_ids} ids are allowed.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return recipe_ids, None
+
+    @action(methods=['GET', 'DELETE'], detail=False, url_path='batch')
+    def batch(self, request):
+        """Return or delete the recipes for a list of recipe ids"""
+        recipe_ids, error = self._get_batch_ids(request)
+        if error:
+            return error
+
+        if request.method == 'DELETE':
+            schedule_recipe_deletion(request.user, recipe_ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        owned = set(self.get_queryset().filter(
+            id__in=recipe_ids
+        ).values_list('id', flat=True))
+        results = self._render([i for i in recipe_ids if i in owned])
+        found = {data['id'] for data in results}
+        missing = [i for i in recipe_ids if i not in found]
+
+        return Response(
+            {'results': results, 'missing': missing},
+            status=status.HTTP_200_OK
+        )
+
+    @action(methods=['GET'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """Return the combined ingredients and totals of a set of recipes"""
+        recipe_ids, error = self._get_batch_ids(request)
+        if error:
+            return error
+
+        recipes = self.queryset.filter(user=request.user, id__in=recipe_ids)
+        totals = recipes.aggregate(
+            recipes=Count('id'),
+            price=Sum('price'),
+            time_minutes=Sum('time_minutes')
+        )
+        ingredients = Recipe.ingredients.through.objects.filter(
+            recipe__in=recipes
+        ).values(
+            'ingredient_id', 'ingredient__name'
+        ).annotate(
+            recipes=Count('recipe_id')
+        ).order_by('ingredient__name', 'ingredient_id')
+
+        return Response({
+            'ingredients': [
+                {
+                    'id': row['ingredient_id'],
+                    'name': row['ingredient__name'],
+                    'recipes': row['recipes']
+                }
+                for row in ingredients
+            ],
+            'recipes': totals['recipes'],
+            'price': totals['price'] or 0,
+            'time_minutes': totals['time_minutes'] or 0
+        })
+
+    @action(methods=['GET'], detail=False, url_path='pantry')
+    def pantry(self, request):
+        """Return the recipes that can be cooked from a set of ingredients
+
+        With missing=k, recipes lacking at most k of their ingredients are
+        included too, fewest missing first.
+        """
+        try:
+            ingredient_ids = set(self._convert_str_list_to_int(
+                request.query_params.get('ingredients', '')
+            ))
+            missing = int(request.query_params.get('missing', 0))
+        except ValueError:
+            return Response(
+                {'ingredients': [
+                    'Expected a comma separated list of integers.'
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 <= missing <= self.pantry_max_missing:
+            return Response(
+                {'missing': [
+                    f'Expected 0 to {self.pantry_max_missing} ingredients.'
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        recipes = self.queryset.filter(
+            user=request.user,
+            ingredient_count__lte=len(ingredient_ids) + missing,
+            ingredients__id__in=ingredient_ids
+        ).annotate(
+            missing_count=F('ingredient_count') - Count('ingredients')
+        ).filter(
+            missing_count__lte=missing
+        ).order_by('missing_count', '-id').prefetch_related(
+            'tags', 'ingredients'
+        )
+        serializer = self.get_serializer(recipes, many=True)
+
+        return Response([
+            dict(data, missing_ingredients=[
+                i for i in data['ingredients'] if i not in ingredient_ids
+            ])
+            for data in serializer.data
+        ])
+
+    @action(methods=['GET'], detail=True, url_path='similar')
+    def similar(self, request, pk=None):
+        """Returns the recipes sharing most ingredients and tags"""
+        recipe = self.get_object()
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response(
+                {'limit': ['Expected an integer.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        scored = similar_recipes(request.user.id, recipe.id, limit)
+        recipes = self.get_queryset().prefetch_related(
+            'tags', 'ingredients'
+        ).in_bulk([recipe_id for recipe_id, _ in scored])
+        scored = [(recipes[i], score) for i, score in scored if i in recipes]
+        serializer = self.get_serializer(
+            [similar for similar, _ in scored], many=True
+        )
+
+        return Response([
+            dict(data, similarity=round(score, 4))
+            for data, (_, score) in zip(serializer.data, scored)
+        ])
+
+    def _get_choice(self, name, choices, default=None):
+        """Return the integer query parameter if it is an allowed choice"""
+        value = self.request.query_params.get(name, default)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return None
+        return value if value in choices else None
+
+    @action(methods=['GET'], detail=True, url_path='image')
+    def image(self, request, pk=None):
+        """Returns the recipe image resized to an allowed width"""
+        recipe = self.get_object()
+        if not recipe.image:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        width = self._get_choice('width', settings.RECIPE_IMAGE_WIDTHS)
+        quality = self._get_choice(
+            'quality',
+            settings.RECIPE_IMAGE_QUALITIES,
+            settings.RECIPE_IMAGE_DEFAULT_QUALITY
+        )
+        if width is None or quality is None:
+            return Response(
+                {
+                    'width': list(settings.RECIPE_IMAGE_WIDTHS),
+                    'quality': list(settings.RECIPE_IMAGE_QUALITIES)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # The URL stays the same when the image is replaced, so clients
+        # revalidate against an ETag of the stored image name
+        etag = quote_etag(f'{recipe.image.name}-w{width}-q{quality}')
+        cache_control = (
+            f'private, max-age={settings.RECIPE_IMAGE_MAX_AGE}, '
+            'must-revalidate'
+        )
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                response = FileResponse(get_variant_cache().open(
+                    recipe.image.path, width, quality
+                ))
+            except FileNotFoundError:
+                raise Http404
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+
+class ChangeViewSet(viewsets.ViewSet):
+    """List what changed in the user's recipes, tags and ingredients"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    querysets = {
+        Change.RECIPE: (
+            Recipe.objects.filter(pending_deletion=False).prefetch_related(
+                'tags', 'ingredients'
+            ),
+            serializers.RecipeSerializer
+        ),
+        Change.TAG: (Tag.objects.all(), serializers.TagSerializer),
+        Change.INGREDIENT: (
+            Ingredient.objects.all(), serializers.IngredientSerializer
+        ),
+    }
+
+    def list(self, request):
+        """Return the changes after ?since=, oldest first
+
+        Follow with since set to the returned seq while more is true. A
+        reset means tombstones the client needed are gone and it has to
+        drop its copy and sync again from since=0.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response(
+                {'since': ['Expected an integer.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        compacted = SyncSequence.objects.filter(
+            user=request.user
+        ).values_list('compacted_seq', flat=True).first() or 0
+        if 0 < since < compacted:
+            return Response({'reset': True, 'seq': 0, 'more': True})
+
+        changes = list(Change.objects.filter(
+            user=request.user, seq__gt=since
+        ).order_by('seq')[:settings.SYNC_PAGE_SIZE + 1])
+        more = len(changes) > settings.SYNC_PAGE_SIZE
+        changes = changes[:settings.SYNC_PAGE_SIZE]
+
+        data = {}
+        for model, (queryset, serializer_class) in self.querysets.items():
+            ids = [c.object_id for c in changes
+                   if c.model == model and not c.deleted]
+            if ids:
+                objects = queryset.filter(user=request.user, id__in=ids)
+                data[model] = {
+                    item['id']: item for item in serializer_class(
+                        objects, many=True, context={'request': request}
+                    ).data
+                }
+
+        return Response({
+            'changes': [
+                {
+                    'seq': change.seq,
+                    'type': change.model,
+                    'id': change.object_id,
+                    'deleted': change.object_id not in data.get(
+                        change.model, {}
+                    ),
+                    'data': data.get(change.model, {}).get(change.object_id)
+                }
+                for change in changes
+            ],
+            'seq': changes[-1].seq if changes else since,
+            'more': more,
+            'reset': False
+        })
+
+    @action(methods=['POST'], detail=False, url_path='stream-ticket')
+    def stream_ticket(self, request):
+        """Issue a short-lived ticket for the event stream
+
+        Browsers cannot send the Token header from an EventSource, so
+        they connect with ?ticket= or the cookie set here instead.
+        """
+        ticket = issue_ticket(request.user)
+        response = Response({
+            'ticket': ticket,
+            'expires_in': settings.EVENTS_TICKET_SECONDS
+        })
+        response.set_cookie(
+            TICKET_COOKIE, ticket,
+            max_age=settings.EVENTS_TICKET_SECONDS,
+            path=EVENTS_PATH,
+            secure=request.is_secure(),
+            httponly=True,
+            samesite='Strict'
+        )
+        return response
@@ -1,7 +1,10 @@
 from user.serializers import UserSerialer, AuthTokenSerializer
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
+
+from core.authentication import CachedTokenAuthentication
+from core.deletion import schedule_user_deletion
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -14,12 +17,16 @@ class CreateTokenView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerialer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
         """Retrieve and return authenticated user"""
         return self.request.user
+
+    def perform_destroy(self, instance):
+        """Delete the user, in the background if deletion is deferred"""
+        schedule_user_deletion(instance)